@@ -0,0 +1,112 @@
+// Appends the later pages of a paged one page STIG as the reader scrolls,
+// from the index.json the build writes next to each page
+// (render_onepage_stig_detail in stigaview_static/html_output.py).
+const container = document.getElementById("onepage-controls");
+const baseUrl = container.dataset.base;
+const pageCount = Number(container.dataset.pages);
+const firstPage = Number(container.dataset.page);
+// First STIG ID on each page, pages are in STIG ID order
+const pageStarts = container.dataset.starts.split(" ");
+// Start loading the next page this far before the reader reaches the end
+const PRELOAD_MARGIN = "1500px 0px";
+
+const bottomPager = [...document.querySelectorAll(".pager")].pop();
+const sentinel = document.createElement("div");
+let lastPage = firstPage;
+let loading = null;
+let failed = false;
+
+
+function pageUrl(page) {
+    return `${baseUrl}/${page}`;
+}
+
+// The page a STIG ID is on: the last page starting at or before it
+function pageOf(id) {
+    let low = 0;
+    let high = pageStarts.length - 1;
+    while (low < high) {
+        const middle = Math.ceil((low + high) / 2);
+        if (pageStarts[middle] <= id) {
+            low = middle;
+        } else {
+            high = middle - 1;
+        }
+    }
+    return low + 1;
+}
+
+async function fetchPage(page) {
+    const response = await fetch(`${baseUrl}/${page}/index.json`);
+    if (!response.ok) {
+        throw new Error(`${response.status} loading page ${page}`);
+    }
+    return response.json();
+}
+
+function loadNextPage() {
+    if (lastPage >= pageCount || failed) {
+        return Promise.resolve();
+    }
+    if (loading === null) {
+        loading = fetchPage(lastPage + 1)
+            .then((data) => {
+                container.insertAdjacentHTML("beforeend", data.html);
+                lastPage = data.page;
+                if (lastPage >= pageCount) {
+                    observer.disconnect();
+                } else {
+                    // Observing again reports the sentinel if it is still in view
+                    observer.unobserve(sentinel);
+                    observer.observe(sentinel);
+                }
+            })
+            .catch((error) => {
+                console.error("Failed to load the next page:", error);
+                // Fall back to the links to the static pages
+                failed = true;
+                observer.disconnect();
+                bottomPager.hidden = false;
+            })
+            .finally(() => {
+                loading = null;
+            });
+    }
+    return loading;
+}
+
+const observer = new IntersectionObserver(
+    (entries) => {
+        if (entries.some((entry) => entry.isIntersecting)) {
+            loadNextPage();
+        }
+    },
+    { rootMargin: PRELOAD_MARGIN },
+);
+
+// Links to onepage/<n>#<STIG ID> keep working when the control is on another page
+async function showHash() {
+    const id = decodeURIComponent(window.location.hash.slice(1));
+    if (!id || document.getElementById(id)) {
+        return;
+    }
+    const page = pageOf(id);
+    if (page < firstPage) {
+        window.location.assign(`${pageUrl(page)}#${encodeURIComponent(id)}`);
+        return;
+    }
+    while (lastPage < page && !failed) {
+        await loadNextPage();
+    }
+    document.getElementById(id)?.scrollIntoView();
+}
+
+
+if (lastPage < pageCount) {
+    // The pages are appended instead, the top pager still jumps ahead
+    bottomPager.hidden = true;
+    container.after(sentinel);
+    observer.observe(sentinel);
+}
+window.addEventListener("hashchange", showHash);
+showHash();
@@ -5,6 +5,16 @@ const MEILISEARCH_INDEX_NAME = "controls";
 
 const SEARCH_LIMIT = 10;
 
+// "offline" searches the per-product index shards written by the build
+// (stigaview_static/search_index.py) instead of Meilisearch
+const SEARCH_BACKEND = document.currentScript?.dataset.backend || "meilisearch";
+const SEARCH_INDEX_PATH = "/search/index";
+// Keep in sync with search_index.py
+const PREFIX_LENGTH = 2;
+const STOP_WORDS = new Set(
+    "a an and are be by for from in is it its must not of on or the that to with".split(" "),
+);
+
 // --- DOM Elements ---
 const openModalBtn = document.getElementById("open-search-modal-btn");
 const modal = document.getElementById("search-modal");
@@ -47,6 +57,7 @@ let productOptions = []; // Will hold all available products
 let stigOptions = {};    // Will map products to their STIG versions
 let selectedProduct = "";
 let selectedStig = "";
+const indexShards = {}; // Product short name to the promise of its shard
 
 function trapFocus(event) {
     if (!modal.classList.contains("active")) return; // Only trap if modal is active
@@ -108,6 +119,150 @@ function buildFilterString() {
 }
 
 
+// --- Offline Search ---
+function tokenize(text) {
+    return (text.toLowerCase().match(/[a-z0-9]+/g) || []).filter(
+        (token) => token.length >= PREFIX_LENGTH && !STOP_WORDS.has(token),
+    );
+}
+
+function escapeHtml(text) {
+    const element = document.createElement("span");
+    element.textContent = text;
+    return element.innerHTML;
+}
+
+function loadShard(product) {
+    if (!indexShards[product]) {
+        indexShards[product] = fetch(`${SEARCH_INDEX_PATH}/${product}.json`).then(
+            (response) => {
+                if (!response.ok) {
+                    throw new Error(`Search index error: ${response.statusText}`);
+                }
+                return response.json();
+            },
+        );
+        // Let a failed load be retried by the next search
+        indexShards[product].catch(() => delete indexShards[product]);
+    }
+    return indexShards[product];
+}
+
+// Postings are delta encoded in the shard, decode a term's list once
+function postings(shard, term) {
+    shard.decoded ??= {};
+    if (!shard.decoded[term]) {
+        let doc = 0;
+        shard.decoded[term] = shard.postings[term].map((delta) => (doc += delta));
+    }
+    return shard.decoded[term];
+}
+
+// Terms that token matches exactly or as a prefix
+function matchTerms(shard, token) {
+    const terms = [];
+    const range = shard.prefixes[token.slice(0, PREFIX_LENGTH)];
+    if (!range) {
+        return terms;
+    }
+    for (let term = range[0]; term < range[1]; term++) {
+        if (shard.terms[term].startsWith(token)) {
+            terms.push(term);
+        }
+    }
+    return terms;
+}
+
+function includesDoc(docs, doc) {
+    let low = 0;
+    let high = docs.length;
+    while (low < high) {
+        const middle = (low + high) >> 1;
+        if (docs[middle] < doc) {
+            low = middle + 1;
+        } else {
+            high = middle;
+        }
+    }
+    return docs[low] === doc;
+}
+
+// Docs matching every token, each scored 2 for an exact term match and 1
+// for a prefix match per token. The rarest token is expanded first and the
+// others are only looked up for its docs, so common tokens stay cheap.
+function searchShard(shard, tokens) {
+    const matches = tokens
+        .map((token) => {
+            const terms = matchTerms(shard, token).map((term) => ({
+                term,
+                score: shard.terms[term] === token ? 2 : 1,
+            }));
+            const size = terms.reduce(
+                (total, { term }) => total + shard.postings[term].length,
+                0,
+            );
+            return { terms, size };
+        })
+        .sort((a, b) => a.size - b.size);
+    const scores = new Map();
+    if (matches.length === 0 || matches[0].size === 0) {
+        return scores;
+    }
+    for (const { term, score } of matches[0].terms) {
+        for (const doc of postings(shard, term)) {
+            scores.set(doc, Math.max(scores.get(doc) || 0, score));
+        }
+    }
+    for (const { terms } of matches.slice(1)) {
+        for (const [doc, total] of scores) {
+            let best = 0;
+            for (const { term, score } of terms) {
+                if (score > best && includesDoc(postings(shard, term), doc)) {
+                    best = score;
+                }
+            }
+            if (best === 0) {
+                scores.delete(doc);
+            } else {
+                scores.set(doc, total + best);
+            }
+        }
+    }
+    return scores;
+}
+
+async function offlineSearch(query) {
+    const tokens = tokenize(query);
+    if (tokens.length === 0) {
+        renderResults([]);
+        return;
+    }
+    const products = selectedProduct ? [selectedProduct] : productOptions;
+    const shards = await Promise.all(products.map(loadShard));
+    const matches = [];
+    shards.forEach((shard, position) => {
+        for (const [doc, score] of searchShard(shard, tokens)) {
+            if (selectedStig && shard.docs[doc][2] !== selectedStig) {
+                continue;
+            }
+            matches.push({ score, doc, position });
+        }
+    });
+    // Best score first, then the newest STIG, which comes first in a shard
+    matches.sort((a, b) => b.score - a.score || a.doc - b.doc);
+    const hits = matches.slice(0, SEARCH_LIMIT).map(({ doc, position }) => {
+        const [path, title, stig, severity] = shards[position].docs[doc];
+        return {
+            path,
+            stig,
+            severity,
+            title: escapeHtml(title),
+            product: products[position],
+        };
+    });
+    renderResults(hits);
+}
+
 // --- Meilisearch Search Function ---
 async function performSearch() {
     let query = searchInput.value.trim();
@@ -118,6 +273,16 @@ async function performSearch() {
 
     resultsContainer.innerHTML = '<p class="results-loading">Loading...</p>';
 
+    if (SEARCH_BACKEND === "offline") {
+        try {
+            await offlineSearch(query);
+        } catch (error) {
+            console.error("Search failed:", error);
+            resultsContainer.innerHTML = `<p class="results-error">Error fetching results. Please try again later.</p>`;
+        }
+        return;
+    }
+
     const searchUrl = `${MEILISEARCH_HOST}/indexes/${MEILISEARCH_INDEX_NAME}/search`;
 
     try {
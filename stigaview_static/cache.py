@@ -0,0 +1,73 @@
+import hashlib
+import logging
+import os
+import pathlib
+import pickle
+import tempfile
+
+DEFAULT_CACHE_DIR = ".cache"
+DEFAULT_MAX_SIZE_MB = 512
+
+
+class ParseCache:
+    """
+    On-disk cache of parsed STIG rows, keyed by content.
+
+    Each entry is a pickled list of the plain tuples returned by
+    import_stig.parse_stig. Entries are touched when read so eviction can
+    drop the least recently used ones first.
+    """
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = pathlib.Path(path)
+        self.max_bytes = max_bytes
+
+    @staticmethod
+    def key(file: pathlib.Path, config_entry: dict, parser_version: str) -> str:
+        # Hashed in chunks so a large STIG is never read into memory at once
+        with open(file, "rb") as f:
+            digest = hashlib.file_digest(f, "sha256")
+        digest.update(repr(sorted(config_entry.items())).encode())
+        digest.update(parser_version.encode())
+        return digest.hexdigest()
+
+    def _entry_path(self, key: str) -> pathlib.Path:
+        return self.path.joinpath(f"{key}.pickle")
+
+    def load(self, key: str) -> list[tuple] | None:
+        entry = self._entry_path(key)
+        try:
+            with open(entry, "rb") as f:
+                rows = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except (pickle.UnpicklingError, EOFError):
+            logging.warning(f"Ignoring corrupt parse cache entry {entry}")
+            return None
+        os.utime(entry)
+        return rows
+
+    def store(self, key: str, rows: list[tuple]) -> None:
+        self.path.mkdir(parents=True, exist_ok=True)
+        # Write to a temporary file first so concurrent workers never see a
+        # partially written entry.
+        fd, tmp_path = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(rows, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self._entry_path(key))
+
+    def evict(self) -> int:
+        """Remove the least recently used entries until under max_bytes."""
+        if not self.path.exists():
+            return 0
+        entries = [(entry, entry.stat()) for entry in self.path.glob("*.pickle")]
+        entries.sort(key=lambda entry: entry[1].st_mtime)
+        total = sum(stat.st_size for _, stat in entries)
+        removed = 0
+        for entry, stat in entries:
+            if total <= self.max_bytes:
+                break
+            entry.unlink(missing_ok=True)
+            total -= stat.st_size
+            removed += 1
+        return removed
@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+import dataclasses
+import hashlib
+from typing import NamedTuple
+
+from stigaview_static import models, profiling
+
+
+class Changelog(NamedTuple):
+    """Controls of a STIG compared with the release before it, by vulnerability ID."""
+
+    previous: models.Stig
+    added: list[models.Control]
+    removed: list[models.Control]
+    # (control in the previous release, control in this one)
+    modified: list[tuple[models.Control, models.Control]]
+
+
+@dataclasses.dataclass(slots=True, eq=False)
+class CrossReference:
+    # CCI to every control that maps to it
+    ccis: dict[str, list[models.Control]]
+    # Vulnerability ID to every release of it, oldest first within a product,
+    # each flagged if its content differs from the product's release before it
+    vulnerabilities: dict[str, list[tuple[models.Control, bool]]]
+    # (product short name, STIG short version) to its changelog, for every
+    # STIG that has an earlier release
+    changelogs: dict[tuple[str, str], Changelog]
+
+
+def content_digest(control: models.Control) -> str:
+    """Digest of what a control requires, ignoring where it is published."""
+    return hashlib.sha256(
+        repr(
+            (
+                control.title,
+                control.severity,
+                control.description,
+                control.check,
+                control.fix,
+                control.srg.srg_id,
+                list(control.cci),
+            )
+        ).encode()
+    ).hexdigest()
+
+
+def _changelog(
+    previous: models.Stig,
+    previous_digests: dict[str, tuple[str, models.Control]],
+    digests: dict[str, tuple[str, models.Control]],
+) -> Changelog:
+    added = list()
+    modified = list()
+    for vulnerability_id, (digest, control) in digests.items():
+        if vulnerability_id not in previous_digests:
+            added.append(control)
+            continue
+        previous_digest, previous_control = previous_digests[vulnerability_id]
+        if previous_digest != digest:
+            modified.append((previous_control, control))
+    removed = [
+        control
+        for vulnerability_id, (_, control) in previous_digests.items()
+        if vulnerability_id not in digests
+    ]
+    modified.sort(key=lambda pair: pair[1].disa_stig_id)
+    return Changelog(previous, sorted(added), sorted(removed), modified)
+
+
+def build(products: list[models.Product]) -> CrossReference:
+    """Build every cross reference in one pass over the finalized products."""
+    with profiling.phase("cross_reference"):
+        ccis: dict[str, list[models.Control]] = dict()
+        vulnerabilities: dict[str, list[tuple[models.Control, bool]]] = dict()
+        changelogs: dict[tuple[str, str], Changelog] = dict()
+        # By product too, products such as RHEL and OL share vulnerability IDs
+        last_digests: dict[tuple[str, str], str] = dict()
+        for product in products:
+            previous: models.Stig | None = None
+            previous_digests: dict[str, tuple[str, models.Control]] = dict()
+            for stig in product.stigs:
+                digests: dict[str, tuple[str, models.Control]] = dict()
+                for control in stig.sorted_controls:
+                    digest = content_digest(control)
+                    digests[control.vulnerability_id] = (digest, control)
+                    for cci in control.cci:
+                        ccis.setdefault(cci, []).append(control)
+                    key = (product.short_name, control.vulnerability_id)
+                    last_digest = last_digests.get(key)
+                    last_digests[key] = digest
+                    vulnerabilities.setdefault(control.vulnerability_id, []).append(
+                        (control, last_digest is not None and last_digest != digest)
+                    )
+                if previous is not None:
+                    changelogs[(product.short_name, stig.short_version)] = _changelog(
+                        previous, previous_digests, digests
+                    )
+                previous = stig
+                previous_digests = digests
+        return CrossReference(
+            dict(sorted(ccis.items())),
+            dict(sorted(vulnerabilities.items())),
+            changelogs,
+        )
@@ -1,15 +1,103 @@
+import functools
+import hashlib
+import itertools
+import json
 import logging
 import multiprocessing
+import multiprocessing.pool
 import os.path
-import shutil
+import pathlib
+import re
+import time
+from typing import Iterable, Iterator, get_args
 
 import minify_html
-from jinja2 import Environment, FileSystemLoader
+from jinja2 import Environment, FileSystemBytecodeCache
 from tqdm import tqdm
 
-from stigaview_static import models
-from stigaview_static.json_output import render_json_control
-from stigaview_static.utils import get_config, get_git_revision_short_hash
+from stigaview_static import (
+    cross_reference,
+    json_output,
+    manifest,
+    minify,
+    models,
+    output,
+    profiling,
+    search_index,
+)
+from stigaview_static.cache import DEFAULT_CACHE_DIR
+from stigaview_static.utils import (
+    get_config,
+    get_git_revision_short_hash,
+    get_pool_context,
+)
+
+DEFAULT_TEMPLATE_CACHE_DIR = os.path.join(DEFAULT_CACHE_DIR, "jinja")
+
+# Rendering is split into work units of at most this many controls
+CONTROL_CHUNK_SIZE = 100
+
+# Pages are collected in memory up to this many characters, larger ones such
+# as one page STIGs are written to disk while they are rendered
+STREAM_THRESHOLD = 256 * 1024
+
+# How the newest STIG of a product is published under products/<p>/latest:
+#   copy      copy every page
+#   hardlink  hardlink every page, copying where the filesystem can't link
+#   symlink   relative symlink to every page, for hosts that serve symlinks
+#   redirect  a small page redirecting to the versioned URL
+#   render    write the rendered page to both locations in one pass, copying
+#             pages too large to keep in memory
+LATEST_STRATEGIES = get_args(models.LatestStrategy)
+DEFAULT_LATEST_STRATEGY = "copy"
+
+# The data being rendered, set in each worker by _init_worker. Work units
+# refer to products, STIGs and SRGs by position instead of carrying them.
+_products: list[models.Product] = list()
+_srgs: dict[str, list[models.Control]] = dict()
+_out_path = ""
+_latest_strategy = DEFAULT_LATEST_STRATEGY
+# Templates are stripped of whitespace when loaded, which leaves minify_html
+# less to do; it still runs over every page unless turned off, as only it
+# gives the smallest output.
+_minify_pages = True
+# Controls per page of the one page STIG and SRG views when they are also
+# written in pages, None to only write the full views. The full view stays
+# at <view>/ and page n is written under <view>/<n>/.
+_onepage_page_size: int | None = None
+_srg_page_size: int | None = None
+# From the config loaded by main, which may not be the one get_config reads
+_search_backend: models.SearchBackend = "meilisearch"
+_references: cross_reference.CrossReference | None = None
+# Where compiled template bytecode is kept between builds, None to not keep it
+_template_cache_dir: str | None = DEFAULT_TEMPLATE_CACHE_DIR
+# Output of the pages rendered by the current work unit, only kept for the
+# render strategy so latest/ is written without reading the page back.
+_rendered: dict[str, str] = dict()
+
+# Parts of pages shared by every page that shows a control, by kind and the
+# control fields the fragment is rendered from. Each is rendered (and
+# minified) once per process, and cached under a digest of its kind and
+# fields so the cache holds no control text. With minify_pages the page only holds a
+# placeholder, spliced after minifying so minify_html never sees fragments.
+FRAGMENTS = {
+    "control_heading": lambda control: (
+        control.url,
+        control.title,
+        control.severity,
+        control.srg.srg_id,
+        tuple(control.cci),
+        control.vulnerability_id,
+    ),
+    "control_body": lambda control: (control.description, control.check, control.fix),
+}
+# Bound on the total length of the minified fragments kept by each process
+FRAGMENT_CACHE_SIZE = 64 * 1024 * 1024
+_fragments: dict[bytes, str] = dict()
+_fragments_size = 0
+# Fragments of the page being rendered, in the order of their placeholders
+_page_fragments: list[str] = list()
+_FRAGMENT_PLACEHOLDER = re.compile(r"<div data-fragment=(\d+)></div>")
 
 
 def _severity_to_cat(severity: str) -> str:
@@ -18,93 +106,667 @@ def _severity_to_cat(severity: str) -> str:
     return mapping.get(severity.lower(), severity)
 
 
-def render_template(template: str, out_path: str, **kwargs):
-    file_loader = FileSystemLoader("templates")
-    env = Environment(loader=file_loader)
+@functools.cache
+def get_environment() -> Environment:
+    """
+    Build the Jinja environment once per process.
+
+    Templates are stripped of whitespace and comments as they are loaded.
+    Compiled templates are kept in the environment's in-memory cache and their
+    bytecode is persisted to the directory set by configure_cache so later
+    builds skip parsing. Worker processes forked after the first render
+    inherit the environment.
+    """
+    bytecode_cache = None
+    if _template_cache_dir is not None:
+        os.makedirs(_template_cache_dir, exist_ok=True)
+        bytecode_cache = FileSystemBytecodeCache(_template_cache_dir)
+    env = Environment(
+        loader=minify.MinifyingLoader("templates"),
+        bytecode_cache=bytecode_cache,
+        auto_reload=False,
+    )
     env.filters["severity_to_cat"] = _severity_to_cat
-    template = env.get_template(template)
-    config = get_config()
-    context = kwargs | config
-    output = template.render(git_sha=get_git_revision_short_hash(), **context)
-    minified = minify_html.minify(output)
-    with open(out_path, "w") as fp:
-        fp.write(minified)
-
-
-def render_product(product: models.Product, out_path: str):
-    out_product = os.path.join(out_path, product.short_name)
-    render_product_index(out_path, product)
-    for stig in product.stigs:
-        real_out_path = render_stig_detail(out_product, product, stig)
-        for control in stig.controls:
-            render_control(control, real_out_path)
-            render_json_control(control, out_path)
-    _copy_latest_stig(out_product, product)
+    env.globals["fragment"] = fragment
+    return env
+
+
+def fragment(kind: str, control: models.Control) -> str:
+    """
+    The fragments/<kind>.html of a control, or a placeholder for it, for templates.
+
+    The fragment is only rendered if no earlier page in this process showed
+    the same content.
+    """
+    global _fragments_size
+    key = hashlib.sha256(repr((kind, FRAGMENTS[kind](control))).encode()).digest()
+    html = _fragments.get(key)
+    if html is None:
+        with profiling.phase(f"fragment:{kind}"):
+            template = get_environment().get_template(f"fragments/{kind}.html")
+            html = template.render(control=control)
+            if _minify_pages:
+                html = minify_html.minify(html)
+        while _fragments and _fragments_size + len(html) > FRAGMENT_CACHE_SIZE:
+            # Oldest first, dicts keep insertion order
+            _fragments_size -= len(_fragments.pop(next(iter(_fragments))))
+        _fragments[key] = html
+        _fragments_size += len(html)
+    if not _minify_pages:
+        return html
+    _page_fragments.append(html)
+    # Written the way minify_html writes it, so it is found either way
+    return f"<div data-fragment={len(_page_fragments) - 1}></div>"
+
+
+def _splice_fragments(page: str) -> Iterator[str]:
+    """Yield page in pieces, with the fragments in place of their placeholders."""
+    position = 0
+    for placeholder in _FRAGMENT_PLACEHOLDER.finditer(page):
+        yield page[position : placeholder.start()]  # noqa: E203
+        yield _page_fragments[int(placeholder[1])]
+        position = placeholder.end()
+    yield page[position:]
+    _page_fragments.clear()
+
+
+def _collect_or_stream(out_path: str, chunks: Iterator[str]) -> str | None:
+    """
+    Join the chunks of a page, or write them to out_path as they are rendered
+    once the page passes STREAM_THRESHOLD, returning None.
+
+    Streamed pages are never held in memory as a whole, so memory per worker
+    stays flat however large a one page STIG or SRG page gets. They aren't
+    kept for the render latest strategy, which copies them instead.
+    """
+    head = list()
+    size = 0
+    for chunk in chunks:
+        head.append(chunk)
+        size += len(chunk)
+        if size >= STREAM_THRESHOLD:
+            output.active().write_stream(out_path, itertools.chain(head, chunks))
+            return None
+    return "".join(head)
+
+
+def render_template(template: str, out_path: str, **kwargs):
+    context = kwargs | get_config() | {"search_backend": _search_backend}
+    build_manifest = manifest.active()
+    if build_manifest is not None:
+        with profiling.phase("manifest_digest"):
+            digest = build_manifest.page_digest(
+                template, context | {"minify_pages": _minify_pages}
+            )
+        if build_manifest.is_fresh(out_path, digest):
+            return
+    with profiling.phase(f"template:{template}"):
+        template = get_environment().get_template(template)
+        chunks = template.generate(git_sha=get_git_revision_short_hash(), **context)
+        if _minify_pages:
+            page = "".join(chunks)
+        else:
+            page = _collect_or_stream(out_path, chunks)
+    if _minify_pages:
+        with profiling.phase("minification"):
+            page = minify_html.minify(page)
+        # Minified pages only hold placeholders for the fragments, which are
+        # most of a large page, so it is streamed as they are spliced in
+        with profiling.phase("fragment_splice"):
+            page = _collect_or_stream(out_path, _splice_fragments(page))
+    if page is None:
+        return
+    # The writer times the write itself, which may happen on a write thread
+    output.active().write(out_path, page)
+    if _latest_strategy == "render":
+        _rendered[out_path] = page
+
+
+def render_json_page(template: str, out_path: str, **kwargs) -> None:
+    """
+    Render template into the html of a compact JSON document, for parts of
+    a page the browser loads later. The document also holds page and pages.
+    """
+    build_manifest = manifest.active()
+    if build_manifest is not None:
+        with profiling.phase("manifest_digest"):
+            digest = build_manifest.page_digest(
+                template, kwargs | {"minify_pages": _minify_pages}
+            )
+        if build_manifest.is_fresh(out_path, digest):
+            return
+    with profiling.phase(f"template:{template}"):
+        html = get_environment().get_template(template).render(**kwargs)
+    if _minify_pages:
+        with profiling.phase("minification"):
+            html = minify_html.minify(html)
+        with profiling.phase("fragment_splice"):
+            html = "".join(_splice_fragments(html))
+    document = {"page": kwargs["page"], "pages": kwargs["pages"], "html": html}
+    with profiling.phase("json_write"):
+        output.active().write(out_path, json.dumps(document, separators=(",", ":")))
+
+
+def configure(
+    minify_pages: bool = True,
+    onepage_page_size: int | None = None,
+    srg_page_size: int | None = None,
+    search_backend: models.SearchBackend = "meilisearch",
+) -> None:
+    global _minify_pages, _onepage_page_size, _srg_page_size, _search_backend
+    global _fragments_size
+    if minify_pages != _minify_pages:
+        # Cached fragments are minified or not to match the pages
+        _fragments.clear()
+        _fragments_size = 0
+    _minify_pages = minify_pages
+    _onepage_page_size = onepage_page_size
+    _srg_page_size = srg_page_size
+    _search_backend = search_backend
+
+
+def configure_cache(path: str | None) -> None:
+    """Keep template bytecode under path, or nowhere when path is None."""
+    global _template_cache_dir
+    if path != _template_cache_dir:
+        _template_cache_dir = path
+        get_environment.cache_clear()
+
+
+def settings() -> tuple[bool, int | None, int | None, models.SearchBackend]:
+    return _minify_pages, _onepage_page_size, _srg_page_size, _search_backend
+
+
+def _paginate(items: list, page_size: int | None) -> list[list]:
+    """Split items into pages, one page without a page size."""
+    if page_size is None or len(items) <= page_size:
+        return [items]
+    return [
+        items[start : start + page_size]  # noqa: E203
+        for start in range(0, len(items), page_size)
+    ]
+
+
+def _page_path(out_path: str, page: int, name: str = "index.html") -> str:
+    """Where a page of a view goes, page 0 being the full view."""
+    if page == 0:
+        return os.path.join(out_path, name)
+    return os.path.join(out_path, str(page), name)
+
+
+def _view_pages(items: list, page_size: int | None, context: dict) -> list[dict]:
+    """
+    Template context of the full view of items, page 0, followed by each of
+    its pages if it has more than one.
+    """
+    pages = _paginate(items, page_size)
+    context = context | {"pages": len(pages)}
+    contexts = [context | {"controls": items, "page": 0}]
+    if len(pages) > 1:
+        contexts.extend(
+            context | {"controls": controls, "page": page}
+            for page, controls in enumerate(pages, 1)
+        )
+    return contexts
+
+
+def onepage_pages(
+    product: models.Product, stig: models.Stig, page_size: int | None = None
+) -> list[dict]:
+    """Template context of a one page STIG, then of each of its pages."""
+    page_size = page_size or _onepage_page_size
+    controls = stig.sorted_controls
+    return _view_pages(
+        controls,
+        page_size,
+        {
+            "product": product,
+            "stig": stig,
+            "base_url": f"{stig.url}/onepage",
+            # Controls are sorted by STIG ID, so the page holding an ID can
+            # be found from the first ID on each page
+            "page_starts": [
+                page[0].disa_stig_id for page in _paginate(controls, page_size) if page
+            ],
+        },
+    )
+
+
+def srg_pages(
+    srg_id: str, controls: list[models.Control], page_size: int | None = None
+) -> list[dict]:
+    """Template context of an SRG, then of each of its pages."""
+    return _view_pages(
+        controls,
+        page_size or _srg_page_size,
+        {"srg_id": srg_id, "base_url": f"/srgs/{srg_id}"},
+    )
 
 
 def render_stig_detail(out_product, product, stig):
+    """Render the STIG and its one page view, returning the pages written."""
     real_out_path = os.path.join(out_product, stig.short_version.lower())
     real_out = os.path.join(real_out_path, "index.html")
-    os.makedirs(real_out_path, exist_ok=True)
-    render_template("stig.html", real_out, product=product, stig=stig)
+    contexts = onepage_pages(product, stig)
+    render_template(
+        "stig.html",
+        real_out,
+        product=product,
+        stig=stig,
+        onepage_page_count=contexts[0]["pages"],
+    )
     one_page_out = os.path.join(real_out_path, "onepage")
-    stig.controls = sorted(stig.controls)
-    render_onepage_stig_detail(one_page_out, product, stig)
-    return real_out_path
-
-
-def render_onepage_stig_detail(out_product, product, stig):
-    real_out = os.path.join(out_product, "index.html")
-    os.makedirs(out_product, exist_ok=True)
-    render_template("one_page_stig.html", real_out, product=product, stig=stig)
-    return out_product
+    return [real_out] + render_onepage_stig_detail(one_page_out, contexts)
+
+
+def render_onepage_stig_detail(out_product, contexts):
+    """
+    Render the one page view and each of its pages, with the controls of
+    pages after the first as JSON for onepage.js to append while the reader
+    scrolls. Returns the files written.
+    """
+    written = list()
+    for context in contexts:
+        real_out = _page_path(out_product, context["page"])
+        render_template("one_page_stig.html", real_out, **context)
+        written.append(real_out)
+        if context["page"] > 1:
+            json_out = _page_path(out_product, context["page"], "index.json")
+            render_json_page(
+                "onepage_controls.html",
+                json_out,
+                controls=context["controls"],
+                page=context["page"],
+                pages=context["pages"],
+            )
+            written.append(json_out)
+    return written
 
 
 def render_control(control, real_out_path):
-    control_out_path = os.path.join(real_out_path, control.disa_stig_id)
-    os.makedirs(control_out_path, exist_ok=True)
-    control_out = os.path.join(control_out_path, "index.html")
+    control_out = os.path.join(real_out_path, control.disa_stig_id, "index.html")
     render_template("control.html", control_out, control=control)
+    return control_out
 
 
 def render_product_index(out_path, product):
     real_out = os.path.join(out_path, product.short_name)
     full_out_path = os.path.join(real_out, "index.html")
-    os.makedirs(real_out, exist_ok=True)
-    product.stigs = sorted(product.stigs)
     render_template("product.html", full_out_path, product=product)
 
 
-def process_product_args(args):
-    product, real_out = args
-    return render_product(product, real_out)
+def _init_worker(
+    products: list[models.Product],
+    srgs: dict,
+    out_path: str,
+    latest_strategy: str,
+    page_settings: tuple[bool, int, int, models.SearchBackend],
+    template_cache_dir: str | None,
+    writer: output.DirectoryWriter | output.TarWriter,
+    build_manifest,
+    profiling_settings: tuple[bool, str | None, int],
+    json_settings: tuple[bool, bool, bool],
+    references: cross_reference.CrossReference | None,
+) -> None:
+    global _products, _srgs, _out_path, _latest_strategy, _references
+    _products = products
+    _srgs = srgs
+    _out_path = out_path
+    _latest_strategy = latest_strategy
+    _references = references
+    configure(*page_settings)
+    configure_cache(template_cache_dir)
+    writer.init_worker()
+    output.activate(writer)
+    manifest.activate(build_manifest)
+    if build_manifest is not None:
+        # The parent already has the entries of every page written so far
+        build_manifest.drain()
+    profiling.init_worker(profiling_settings)
+    json_output.init_worker(json_settings)
+
+
+def _chunk_controls(controls: list[models.Control]) -> Iterator[tuple[int, int]]:
+    # Controls that share a STIG ID write to the same path, so they stay in
+    # one chunk to keep the last one winning as in a serial build.
+    start = 0
+    while start < len(controls):
+        end = min(start + CONTROL_CHUNK_SIZE, len(controls))
+        while (
+            end < len(controls)
+            and controls[end - 1].disa_stig_id == controls[end].disa_stig_id
+        ):
+            end += 1
+        yield start, end
+        start = end
+
+
+def _chunk_keys(kind: str, items: dict) -> Iterator[tuple[int, tuple]]:
+    """Group the keys of items into weighted units of about CONTROL_CHUNK_SIZE values."""
+    keys: list[str] = list()
+    weight = 0
+    for key, values in items.items():
+        keys.append(key)
+        weight += len(values)
+        if weight >= CONTROL_CHUNK_SIZE:
+            yield weight, (kind, tuple(keys))
+            keys = list()
+            weight = 0
+    if keys:
+        yield weight, (kind, tuple(keys))
+
+
+def _plan_product_units(
+    product_index: int,
+    product: models.Product,
+    references: cross_reference.CrossReference | None = None,
+) -> Iterator[tuple[int, tuple]]:
+    """Weighted units for the pages of one product."""
+    yield len(product.stigs), ("product", product_index)
+    yield (
+        sum(len(stig.controls) for stig in product.stigs),
+        ("search", product_index),
+    )
+    for stig_index, stig in enumerate(product.stigs):
+        yield len(stig.controls), ("stig", product_index, stig_index)
+        for start, end in _chunk_controls(stig.sorted_controls):
+            yield end - start, ("controls", product_index, stig_index, start, end)
+        if references is not None and stig is not product.stigs[0]:
+            changelog = references.changelogs[(product.short_name, stig.short_version)]
+            yield (
+                len(changelog.added) + len(changelog.removed) + len(changelog.modified),
+                ("changes", product_index, stig_index),
+            )
+
+
+def _plan_shared_units(
+    srgs: dict, references: cross_reference.CrossReference | None = None
+) -> Iterator[tuple[int, tuple]]:
+    """Weighted units for the pages listing controls from every product."""
+    yield from _chunk_keys("srgs", srgs)
+    if references is not None:
+        yield from _chunk_keys("ccis", references.ccis)
+        yield from _chunk_keys("vulnerabilities", references.vulnerabilities)
+
+
+def _plan_units(
+    products: list[models.Product],
+    srgs: dict,
+    references: cross_reference.CrossReference | None = None,
+    product_pages: bool = True,
+) -> list[tuple]:
+    """
+    Split rendering into work units, ordered from most to least expensive.
+
+    Units reference products, STIGs and SRGs by position so they are cheap to
+    send to workers. The weight of a unit is the number of controls it renders.
+    """
+    weighted_units = list()
+    if product_pages:
+        for product_index, product in enumerate(products):
+            weighted_units.extend(
+                _plan_product_units(product_index, product, references)
+            )
+    weighted_units.extend(_plan_shared_units(srgs, references))
+    weighted_units.sort(key=lambda weighted_unit: weighted_unit[0], reverse=True)
+    return [unit for _, unit in weighted_units]
+
+
+def _page_directories(
+    out_path: str, items: list, page_size: int | None
+) -> Iterator[str]:
+    pages = _paginate(items, page_size)
+    if len(pages) > 1:
+        for page in range(1, len(pages) + 1):
+            yield os.path.join(out_path, str(page))
+
+
+def _output_directories(
+    products: list[models.Product],
+    srgs: dict,
+    out_path: str,
+    references: cross_reference.CrossReference | None = None,
+    product_pages: bool = True,
+) -> Iterator[str]:
+    """Every directory the work units write to."""
+    real_out = os.path.join(out_path, "products")
+    for srg_id, controls in srgs.items():
+        yield os.path.join(out_path, "srgs", srg_id)
+        yield from _page_directories(
+            os.path.join(out_path, "srgs", srg_id), controls, _srg_page_size
+        )
+    if references is not None:
+        for cci in references.ccis:
+            yield os.path.join(out_path, "ccis", cci)
+        for vulnerability_id in references.vulnerabilities:
+            yield os.path.join(out_path, "vulnerabilities", f"V-{vulnerability_id}")
+    if not product_pages:
+        return
+    yield os.path.join(out_path, json_output.SEARCH_EXPORT_DIR)
+    if json_output.search_index_enabled():
+        yield os.path.join(out_path, search_index.SEARCH_INDEX_DIR)
+    if json_output.json_controls_enabled():
+        yield os.path.join(out_path, "json_controls")
+    for product in products:
+        out_product = os.path.join(real_out, product.short_name)
+        for stig in product.stigs:
+            versions = [stig.short_version.lower()]
+            if stig is product.latest_stig:
+                versions.append("latest")
+            for version in versions:
+                yield os.path.join(out_product, version, "onepage")
+                yield from _page_directories(
+                    os.path.join(out_product, version, "onepage"),
+                    stig.sorted_controls,
+                    _onepage_page_size,
+                )
+                for control in stig.controls:
+                    yield os.path.join(out_product, version, control.disa_stig_id)
+    if references is not None:
+        for product_name, version in references.changelogs:
+            yield os.path.join(real_out, product_name, version.lower(), "changes")
+
+
+def _copy_to_latest(
+    out_product: str, product: models.Product, stig: models.Stig, source: str
+) -> None:
+    if stig is not product.latest_stig:
+        return
+    versioned_root = os.path.join(out_product, stig.short_version.lower())
+    target = os.path.join(
+        out_product, "latest", os.path.relpath(source, versioned_root)
+    )
+    build_manifest = manifest.active()
+    if build_manifest is not None and build_manifest.is_fresh(
+        target,
+        manifest.fingerprint((_latest_strategy, build_manifest.digest_of(source))),
+    ):
+        return
+    with profiling.phase(f"latest_{_latest_strategy}"):
+        _publish_latest(source, target)
+
+
+def _publish_latest(source: str, target: str) -> None:
+    # The writer replaces whatever is at target, so switching strategies
+    # never writes through a link left behind by another one.
+    writer = output.active()
+    if _latest_strategy == "hardlink":
+        writer.link(source, target)
+    elif _latest_strategy == "symlink":
+        writer.symlink(source, target)
+    elif _latest_strategy == "redirect" and target.endswith(".html"):
+        versioned = os.path.relpath(os.path.dirname(source), _out_path)
+        url = f"/{pathlib.PurePath(versioned).as_posix()}"
+        page = get_environment().get_template("redirect.html").render(url=url)
+        writer.replace(target, minify_html.minify(page) if _minify_pages else page)
+    elif _latest_strategy == "render" and source in _rendered:
+        writer.replace(target, _rendered[source])
+    else:
+        writer.copy(source, target)
+
+
+def render_unit(unit: tuple) -> tuple[dict[str, str] | None, dict | None]:
+    """
+    Render one work unit from _plan_units.
+
+    Returns the manifest entries and profiling timings recorded while doing
+    so, for the parent process to merge.
+    """
+    start = time.perf_counter()
+    _render_unit(unit)
+    output.active().flush()
+    _rendered.clear()
+    if unit[0] not in ("srgs", "ccis", "vulnerabilities"):
+        product = _products[unit[1]]
+        profiling.add_product_time(
+            product.short_name, "render", time.perf_counter() - start
+        )
+    build_manifest = manifest.active()
+    entries = build_manifest.drain() if build_manifest is not None else None
+    return entries, profiling.drain()
+
+
+def _render_unit(unit: tuple) -> None:
+    kind, *args = unit
+    real_out = os.path.join(_out_path, "products")
+    if kind == "product":
+        render_product_index(real_out, _products[args[0]])
+    elif kind == "stig":
+        product = _products[args[0]]
+        stig = product.stigs[args[1]]
+        out_product = os.path.join(real_out, product.short_name)
+        for page in render_stig_detail(out_product, product, stig):
+            _copy_to_latest(out_product, product, stig, page)
+    elif kind == "controls":
+        product = _products[args[0]]
+        stig = product.stigs[args[1]]
+        out_product = os.path.join(real_out, product.short_name)
+        real_out_path = os.path.join(out_product, stig.short_version.lower())
+        for control in stig.sorted_controls[args[2] : args[3]]:  # noqa: E203
+            control_out = render_control(control, real_out_path)
+            _copy_to_latest(out_product, product, stig, control_out)
+            if json_output.json_controls_enabled():
+                json_output.render_json_control(control, real_out)
+    elif kind == "search":
+        json_output.write_search_export(_products[args[0]], _out_path)
+        if json_output.search_index_enabled():
+            search_index.write_search_index(_products[args[0]], _out_path)
+    elif kind == "changes":
+        product = _products[args[0]]
+        stig = product.stigs[args[1]]
+        changelog = _references.changelogs[(product.short_name, stig.short_version)]
+        render_changelog(
+            os.path.join(real_out, product.short_name), product, stig, changelog
+        )
+    elif kind == "srgs":
+        render_srg_details(_srgs, args[0], _out_path)
+    elif kind == "ccis":
+        render_cci_details(_references.ccis, args[0], _out_path)
+    elif kind == "vulnerabilities":
+        render_vulnerability_histories(_references.vulnerabilities, args[0], _out_path)
+
+
+def render_product(
+    product: models.Product, references: cross_reference.CrossReference
+) -> None:
+    """
+    Render every page of one product in this worker.
+
+    For the pipelined build, where a product only exists in the worker that
+    parsed it. references only needs the changelogs of the product.
+    """
+    global _products, _references
+    start = time.perf_counter()
+    _products = [product]
+    _references = references
+    try:
+        for _, unit in _plan_product_units(0, product, references):
+            _render_unit(unit)
+            output.active().flush()
+            _rendered.clear()
+    finally:
+        _products = list()
+        _references = None
+    profiling.add_product_time(
+        product.short_name, "render", time.perf_counter() - start
+    )
+
+
+def render_pool(
+    products: list[models.Product],
+    srgs: dict,
+    out_path: str,
+    latest_strategy: str = DEFAULT_LATEST_STRATEGY,
+    references: cross_reference.CrossReference | None = None,
+) -> multiprocessing.pool.Pool:
+    """Start the render workers, each holding the data being rendered."""
+    writer = output.active()
+    writer.before_fork()
+    # With fork the initializer arguments are inherited copy-on-write rather
+    # than pickled, so the product graph never goes through a pipe.
+    return get_pool_context().Pool(
+        multiprocessing.cpu_count(),
+        initializer=_init_worker,
+        initargs=(
+            products,
+            srgs,
+            out_path,
+            latest_strategy,
+            settings(),
+            _template_cache_dir,
+            writer,
+            manifest.active(),
+            profiling.settings(),
+            json_output.settings(),
+            references,
+        ),
+    )
 
 
-def write_products(products: list[models.Product], out_path: str) -> None:
+def write_products(
+    products: list[models.Product],
+    srgs: dict,
+    out_path: str,
+    latest_strategy: str = DEFAULT_LATEST_STRATEGY,
+    references: cross_reference.CrossReference | None = None,
+    product_pages: bool = True,
+) -> None:
+    """
+    Render the products index and every work unit.
+
+    Without product_pages only the pages listing controls from every product
+    are rendered, for the pipelined build that renders each product's own
+    pages as soon as it is parsed.
+    """
     logging.info("Beginning rendering products")
     real_out = os.path.join(out_path, "products")
     full_out_path = os.path.join(real_out, "index.html")
-    os.makedirs(real_out, exist_ok=True)
     render_template("products.html", full_out_path, products=sorted(products))
-    with multiprocessing.Pool(multiprocessing.cpu_count()) as pool:
-        list(
-            tqdm(
-                pool.imap(
-                    process_product_args, [(product, real_out) for product in products]
-                ),
-                total=len(products),
-                desc="Rendering products",
-                mininterval=0.5,
-                unit="product",
-            )
-        )
+    units = _plan_units(products, srgs, references, product_pages)
+    build_manifest = manifest.active()
+    output.active().makedirs(
+        _output_directories(products, srgs, out_path, references, product_pages)
+    )
+    with render_pool(products, srgs, out_path, latest_strategy, references) as pool:
+        for entries, timings in tqdm(
+            pool.imap_unordered(render_unit, units),
+            total=len(units),
+            desc="Rendering pages",
+            mininterval=0.5,
+            unit="unit",
+        ):
+            if build_manifest is not None:
+                build_manifest.update(entries)
+            profiling.merge(timings)
+        # Let the workers exit on their own so they close their output
+        pool.close()
+        pool.join()
 
 
 def render_stig_index(products: list[models.Product], out_path: str) -> None:
     logging.info("Rendering stig index")
     real_out = os.path.join(out_path, "stigs")
     full_out_path = os.path.join(real_out, "index.html")
-    os.makedirs(real_out, exist_ok=True)
     stigs = list()
     for product in products:
         for stig in product.stigs:
@@ -131,24 +793,74 @@ def render_srg_index(srgs: dict, out_path: str) -> None:
     logging.info("Rendering SRG index")
     real_out = os.path.join(out_path, "srgs")
     full_out_path = os.path.join(real_out, "index.html")
-    os.makedirs(real_out, exist_ok=True)
     render_template("srgs.html", full_out_path, srgs=srgs)
-    render_srg_details(srgs, out_path)
 
 
-def render_srg_details(srgs: dict, out_path: str) -> None:
-    for srg_id in tqdm(srgs.keys(), desc="Rendering SRG details", unit="page"):
-        controls = srgs[srg_id]
-        full_out_path = os.path.join(out_path, "srgs", srg_id)
-        os.makedirs(full_out_path, exist_ok=True)
-        full_out = os.path.join(full_out_path, "index.html")
-        render_template("srg_detail.html", full_out, controls=controls, srg_id=srg_id)
+def render_srg_details(srgs: dict, srg_ids: Iterable[str], out_path: str) -> None:
+    for srg_id in srg_ids:
+        out_srg = os.path.join(out_path, "srgs", srg_id)
+        for context in srg_pages(srg_id, srgs[srg_id]):
+            render_template(
+                "srg_detail.html", _page_path(out_srg, context["page"]), **context
+            )
 
 
-def _copy_latest_stig(out_product: str, product: models.Product):
-    latest_stig = product.latest_stig
-    current_versioned_root = os.path.join(
-        out_product, latest_stig.short_version.lower()
+def render_changelog(
+    out_product: str,
+    product: models.Product,
+    stig: models.Stig,
+    changelog: cross_reference.Changelog,
+) -> None:
+    out_changes = os.path.join(out_product, stig.short_version.lower(), "changes")
+    render_template(
+        "changes.html",
+        os.path.join(out_changes, "index.html"),
+        product=product,
+        stig=stig,
+        previous=changelog.previous,
+        added=changelog.added,
+        removed=changelog.removed,
+        modified=changelog.modified,
     )
-    product_latest_path = os.path.join(out_product, "latest")
-    shutil.copytree(current_versioned_root, product_latest_path)
+    json_output.write_json(
+        os.path.join(out_changes, "index.json"),
+        json_output.changelog_json(product, stig, changelog),
+    )
+
+
+def render_cci_index(references: cross_reference.CrossReference, out_path: str) -> None:
+    logging.info("Rendering CCI index")
+    full_out_path = os.path.join(out_path, "ccis", "index.html")
+    render_template("ccis.html", full_out_path, ccis=references.ccis)
+
+
+def render_cci_details(ccis: dict, cci_ids: Iterable[str], out_path: str) -> None:
+    for cci in cci_ids:
+        controls = ccis[cci]
+        out_cci = os.path.join(out_path, "ccis", cci)
+        render_template(
+            "cci.html", os.path.join(out_cci, "index.html"), controls=controls, cci=cci
+        )
+        json_output.write_json(
+            os.path.join(out_cci, "index.json"), json_output.cci_json(cci, controls)
+        )
+
+
+def render_vulnerability_histories(
+    vulnerabilities: dict, vulnerability_ids: Iterable[str], out_path: str
+) -> None:
+    for vulnerability_id in vulnerability_ids:
+        history = vulnerabilities[vulnerability_id]
+        out_vulnerability = os.path.join(
+            out_path, "vulnerabilities", f"V-{vulnerability_id}"
+        )
+        render_template(
+            "vulnerability.html",
+            os.path.join(out_vulnerability, "index.html"),
+            vulnerability_id=vulnerability_id,
+            history=history,
+        )
+        json_output.write_json(
+            os.path.join(out_vulnerability, "index.json"),
+            json_output.vulnerability_json(vulnerability_id, history),
+        )
@@ -1,16 +1,34 @@
 import datetime
+import functools
+import hashlib
 import html
 import os.path
 import pathlib
 import re
+import sys
 import xml.etree.ElementTree as ET
+from typing import IO, Iterator
 
-from stigaview_static import models, utils
+from stigaview_static import models, profiling, utils
+from stigaview_static.cache import ParseCache
 
 NS = {
     "xccdf-1.2": "http://checklists.nist.gov/xccdf/1.2",
     "xccdf-1.1": "http://checklists.nist.gov/xccdf/1.1",
 }
+GROUP_TAG = f"{{{NS['xccdf-1.1']}}}Group"
+
+
+def _parser_version() -> str:
+    """Digest of the code that turns STIG XML into rows and models."""
+    digest = hashlib.sha256()
+    for source in (__file__, models.__file__):
+        digest.update(pathlib.Path(source).read_bytes())
+    return digest.hexdigest()
+
+
+# Part of every parse cache key, so any change to the parser drops cached parses
+PARSER_VERSION = _parser_version()
 
 KNOWN_DESCRIPTION_ELEMENTS = {
     "VulnDiscussion",
@@ -27,10 +45,37 @@ KNOWN_DESCRIPTION_ELEMENTS = {
 }
 
 
+_KNOWN_ELEMENT = "|".join(sorted(KNOWN_DESCRIPTION_ELEMENTS))
+# Text and placeholders such as <ADMIN_NAME>, which are kept as literal text
+_TEXT = rf"(?:[^<\r]++|<(?!(?:{_KNOWN_ELEMENT})>)[a-zA-Z0-9_-]+>)"
+# The descriptions in DISA STIGs are a flat run of the known elements:
+# <VulnDiscussion>...</VulnDiscussion><FalsePositives></FalsePositives>...
+_DESCRIPTION = re.compile(
+    rf"[^<]*+<VulnDiscussion>(?P<discussion>{_TEXT}++)</VulnDiscussion>"
+    rf"(?:[^<]++|<(?P<tag>{_KNOWN_ELEMENT})>{_TEXT}*+</(?P=tag)>)*+"
+)
+_PLACEHOLDER = re.compile(r"<([a-zA-Z0-9_-]+)>")
+
+
 def _disa_text_to_html(text: str) -> str:
     return html.escape(text, True).replace("\n", "<br />")
 
 
+def _parse_vuln_discussion(raw_description: str) -> str | None:
+    """
+    Pull the VulnDiscussion text out of a description in one pass.
+
+    Returns the same text as reading it from _get_description_root, or None
+    if the description is not a flat run of known elements and has to go
+    through ElementTree instead.
+    """
+    match = _DESCRIPTION.fullmatch(raw_description)
+    if match is None or "]]>" in raw_description:
+        return None
+    # Placeholders end up as escaped text after the round trip through XML
+    return _PLACEHOLDER.sub(r"&lt;\1&gt;", match.group("discussion"))
+
+
 def _escape_placeholders(text: str) -> str:
     def replacer(match):
         tag = match.group(1)
@@ -41,8 +86,7 @@ def _escape_placeholders(text: str) -> str:
     return re.sub(r"<([a-zA-Z0-9_-]+)>", replacer, text)
 
 
-def _get_description_root(stig_xml: ET.Element) -> dict:
-    raw_description = stig_xml.find("xccdf-1.1:description", NS).text
+def _get_description_root(raw_description: str) -> ET.Element:
     part_escaped = (
         _escape_placeholders(raw_description)
         .replace("<<<", "&lt;&lt;&lt;")
@@ -53,55 +97,149 @@ def _get_description_root(stig_xml: ET.Element) -> dict:
     return description_root
 
 
+def _get_vuln_discussion(raw_description: str) -> str:
+    discussion = _parse_vuln_discussion(raw_description)
+    if discussion is None:
+        discussion = _get_description_root(raw_description).find("VulnDiscussion").text
+    return discussion
+
+
 def import_stig(
     stig_path: pathlib.Path, release_date: datetime.date, product: models.Product
 ) -> tuple[models.Stig, dict]:
-    root = _get_root_from_xml_path(stig_path)
-    release, version = _get_stig_version(str(stig_path.absolute()))
-    stig = models.Stig(
-        version=version, release=release, release_date=release_date, product=product
-    )
-    srgs = dict()
-    for group in root.findall("xccdf-1.1:Group", NS):
+    return build_stig(stig_path, parse_stig(stig_path), release_date, product)
+
+
+def parse_stig(stig_path: pathlib.Path | IO[bytes]) -> list[tuple]:
+    """
+    Parse a STIG XML file, or a binary file object, into one plain tuple per rule.
+
+    The tuples only hold strings so they are cheap to send between processes.
+    See build_stig for turning them into models.
+    """
+    with profiling.phase("xml_parse"):
+        return _parse_rows(stig_path)
+
+
+def parse_stig_file(
+    file: pathlib.Path, config_entry: dict, parse_cache: ParseCache | None
+) -> tuple[list[tuple], bool]:
+    """
+    parse_stig through the parse cache, returning the rows and whether they
+    came from the cache.
+    """
+    if parse_cache is None:
+        return parse_stig(file), False
+    with profiling.phase("parse_cache"):
+        key = parse_cache.key(file, config_entry, PARSER_VERSION)
+        rows = parse_cache.load(key)
+    if rows is not None:
+        return rows, True
+    rows = parse_stig(file)
+    with profiling.phase("parse_cache"):
+        parse_cache.store(key, rows)
+    return rows, False
+
+
+def _parse_rows(stig_path: pathlib.Path | IO[bytes]) -> list[tuple]:
+    rows = list()
+    for group in _iter_groups(stig_path):
+        vulnerability_id = group.attrib["id"].replace("V-", "")
         for stig_xml in group.findall("xccdf-1.1:Rule", NS):
             srg_id = group.find("xccdf-1.1:title", NS).text
             title = stig_xml.find("xccdf-1.1:title", NS).text
-            description_root = _get_description_root(stig_xml)
             cci_from_source = stig_xml.findall(
                 "xccdf-1.1:ident[@system='http://cyber.mil/cci']", NS
             )
             ccis = list()
             for cci in cci_from_source:
                 ccis.append(cci.text)
-            stig = stig
             severity = stig_xml.attrib["severity"]
-            srg = models.Srg(srg_id=srg_id)
             disa_stig_id = stig_xml.find("xccdf-1.1:version", NS).text
-            description = _disa_text_to_html(
-                description_root.find("VulnDiscussion").text
-            )
-            fix = _disa_text_to_html(stig_xml.find("xccdf-1.1:fixtext", NS).text)
-            check = _disa_text_to_html(
-                stig_xml.find("xccdf-1.1:check/xccdf-1.1:check-content", NS).text
-            )
-            vulnerability_id = group.attrib["id"].replace("V-", "")
-            control = models.Control(
-                stig=stig,
-                severity=severity,
-                srg=srg,
-                disa_stig_id=disa_stig_id,
-                description=description,
-                fix=fix,
-                check=check,
-                cci=ccis,
-                title=title,
-                vulnerability_id=vulnerability_id,
+            with profiling.phase("description_escaping"):
+                description = _disa_text_to_html(
+                    _get_vuln_discussion(
+                        stig_xml.find("xccdf-1.1:description", NS).text
+                    )
+                )
+                fix = _disa_text_to_html(stig_xml.find("xccdf-1.1:fixtext", NS).text)
+                check = _disa_text_to_html(
+                    stig_xml.find("xccdf-1.1:check/xccdf-1.1:check-content", NS).text
+                )
+            rows.append(
+                (
+                    srg_id,
+                    vulnerability_id,
+                    disa_stig_id,
+                    severity,
+                    title,
+                    description,
+                    fix,
+                    check,
+                    tuple(ccis),
+                )
             )
-            utils.update_dict_list(srgs, srg_id, control)
-            stig.controls.append(control)
+    return rows
+
+
+def build_stig(
+    stig_path: pathlib.Path,
+    rows: list[tuple],
+    release_date: datetime.date,
+    product: models.Product,
+) -> tuple[models.Stig, dict]:
+    with profiling.phase("model_construction"):
+        return _build_stig(stig_path, rows, release_date, product)
+
+
+def _build_stig(
+    stig_path: pathlib.Path,
+    rows: list[tuple],
+    release_date: datetime.date,
+    product: models.Product,
+) -> tuple[models.Stig, dict]:
+    release, version = _get_stig_version(str(stig_path.absolute()))
+    stig = models.Stig(
+        version=int(version),
+        release=int(release),
+        release_date=release_date,
+        product=product,
+    )
+    srgs = dict()
+    for (
+        srg_id,
+        vulnerability_id,
+        disa_stig_id,
+        severity,
+        title,
+        description,
+        fix,
+        check,
+        ccis,
+    ) in rows:
+        control = models.Control(
+            stig=stig,
+            severity=sys.intern(severity),
+            srg=_get_srg(srg_id),
+            disa_stig_id=disa_stig_id,
+            description=description,
+            fix=fix,
+            check=check,
+            cci=[sys.intern(cci) for cci in ccis],
+            title=title,
+            vulnerability_id=vulnerability_id,
+        )
+        utils.update_dict_list(srgs, srg_id, control)
+        stig.controls.append(control)
     return stig, srgs
 
 
+@functools.cache
+def _get_srg(srg_id: str) -> models.Srg:
+    # Controls from every STIG that map to an SRG share one instance.
+    return models.Srg(srg_id=sys.intern(srg_id))
+
+
 def _get_stig_version(stig_path):
     base_name = os.path.basename(stig_path)
     matcher = r"^v(?P<version>\d+)r(?P<release>\d+).xml$"
@@ -114,7 +252,22 @@ def _get_stig_version(stig_path):
     return release, version
 
 
-def _get_root_from_xml_path(stig_path) -> ET.ElementTree:
-    with open(stig_path, encoding="utf-8") as stig_file:
-        root = ET.ElementTree(ET.fromstring(stig_file.read()))
-    return root
+def _iter_groups(stig_path: pathlib.Path | IO[bytes]) -> Iterator[ET.Element]:
+    """
+    Incrementally parse a STIG and yield each top-level Group.
+
+    A Group is discarded once the caller is done with it, so memory is bounded
+    by the largest Group rather than the whole document.
+    """
+    root = None
+    depth = 0
+    for event, element in ET.iterparse(stig_path, events=("start", "end")):
+        if event == "start":
+            if root is None:
+                root = element
+            depth += 1
+            continue
+        depth -= 1
+        if depth == 1 and element.tag == GROUP_TAG:
+            yield element
+            root.clear()
@@ -1,10 +1,44 @@
 import collections
+import gzip
+import hashlib
+import io
 import json
 import os
 import pathlib
-from typing import Dict
+from typing import Dict, Iterator
 
-from stigaview_static import models
+from stigaview_static import cross_reference, manifest, models, output, profiling
+
+SEARCH_EXPORT_DIR = "search"
+
+# Set by configure in the parent and by init_worker in render workers
+_json_controls = False
+_compress_search = False
+_search_index = False
+
+
+def configure(json_controls: bool, compress_search: bool, search_index: bool) -> None:
+    global _json_controls, _compress_search, _search_index
+    _json_controls = json_controls
+    _compress_search = compress_search
+    _search_index = search_index
+
+
+def settings() -> tuple[bool, bool, bool]:
+    return _json_controls, _compress_search, _search_index
+
+
+def init_worker(worker_settings: tuple[bool, bool, bool]) -> None:
+    configure(*worker_settings)
+
+
+def json_controls_enabled() -> bool:
+    return _json_controls
+
+
+def search_index_enabled() -> bool:
+    """Whether to write the search/index shards for offline search."""
+    return _search_index
 
 
 def write_product_stig_map(products: list[models.Product], out_dir: str):
@@ -12,18 +46,134 @@ def write_product_stig_map(products: list[models.Product], out_dir: str):
     products_list: Dict[str, str] = dict()
     for product in products:
         products_list[product.short_name] = product.full_name
-        for stig in sorted(product.stigs):
+        for stig in product.stigs:
             product_stig_map[product.short_name].append(stig.short_version)
 
-    with open(os.path.join(out_dir, "product-stig-map.json"), "w") as f:
-        f.write(json.dumps(product_stig_map, indent=0))
-    with open(os.path.join(out_dir, "products.json"), "w") as f:
-        f.write(json.dumps(products_list, indent=0))
+    writer = output.active()
+    writer.write(
+        os.path.join(out_dir, "product-stig-map.json"),
+        json.dumps(product_stig_map, indent=0),
+    )
+    writer.write(
+        os.path.join(out_dir, "products.json"), json.dumps(products_list, indent=0)
+    )
+
+
+def search_export_path(out_path: str, product: models.Product) -> str:
+    name = f"{product.short_name}.ndjson"
+    if _compress_search:
+        name += ".gz"
+    return os.path.join(out_path, SEARCH_EXPORT_DIR, name)
+
+
+def write_search_export(product: models.Product, out_path: str) -> None:
+    """Write the search documents of every control of product as one NDJSON shard."""
+    with profiling.phase("search_export"):
+        _write_search_export(product, out_path)
+
+
+def _write_search_export(product: models.Product, out_path: str) -> None:
+    path = search_export_path(out_path, product)
+    build_manifest = manifest.active()
+    if build_manifest is not None and build_manifest.is_fresh(
+        path, manifest.fingerprint((_compress_search, product))
+    ):
+        return
+    output.active().write_stream(path, _search_export_chunks(product))
+
+
+def _search_export_chunks(product: models.Product) -> Iterator[bytes]:
+    """The NDJSON shard of product, in chunks of about output.WRITE_BUFFER_SIZE."""
+    buffer = io.BytesIO()
+    stream = (
+        gzip.GzipFile(fileobj=buffer, mode="wb", mtime=0)
+        if _compress_search
+        else buffer
+    )
+    for stig in product.stigs:
+        # A reused STIG ID keeps the last control, like the per control files
+        for control in stig.controls_by_id.values():
+            stream.write(json.dumps(control.to_search_json()).encode())
+            stream.write(b"\n")
+            if buffer.tell() >= output.WRITE_BUFFER_SIZE:
+                # GzipFile only appends to buffer, so it can be emptied
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+    if stream is not buffer:
+        stream.close()
+    yield buffer.getvalue()
+
+
+def _control_reference(control: models.Control) -> dict[str, str]:
+    return {
+        "product": control.stig.product.short_name,
+        "stig": control.stig.short_version,
+        "disa_stig_id": control.disa_stig_id,
+        "vulnerability_id": control.vulnerability_id,
+        "severity": control.severity,
+        "title": control.title,
+        "path": control.url,
+    }
+
+
+def write_json(path: str, data: object) -> None:
+    """Write data as JSON, unless an incremental build already has it."""
+    with profiling.phase("json_write"):
+        content = json.dumps(data, indent=0)
+        build_manifest = manifest.active()
+        if build_manifest is not None:
+            digest = hashlib.sha256(content.encode()).hexdigest()
+            if build_manifest.is_fresh(path, digest):
+                return
+        output.active().write(path, content)
+
+
+def cci_json(cci: str, controls: list[models.Control]) -> dict:
+    return {"cci": cci, "controls": [_control_reference(c) for c in controls]}
+
+
+def vulnerability_json(
+    vulnerability_id: str, history: list[tuple[models.Control, bool]]
+) -> dict:
+    return {
+        "vulnerability_id": vulnerability_id,
+        "history": [
+            _control_reference(control)
+            | {
+                "release_date": control.stig.release_date.strftime("%Y-%m-%d"),
+                "changed": changed,
+            }
+            for control, changed in history
+        ],
+    }
+
+
+def changelog_json(
+    product: models.Product, stig: models.Stig, changelog: cross_reference.Changelog
+) -> dict:
+    return {
+        "product": product.short_name,
+        "stig": stig.short_version,
+        "previous": changelog.previous.short_version,
+        "added": [_control_reference(c) for c in changelog.added],
+        "removed": [_control_reference(c) for c in changelog.removed],
+        "modified": [_control_reference(c) for _, c in changelog.modified],
+    }
 
 
 def render_json_control(control: models.Control, real_out_path: str):
-    out_path = pathlib.Path(real_out_path).joinpath("..", "json_controls")
-    if not out_path.exists():
-        out_path.mkdir(parents=True)
+    with profiling.phase("json_write"):
+        _write_json_control(control, real_out_path)
+
+
+def _write_json_control(control: models.Control, real_out_path: str):
+    out_path = pathlib.Path(real_out_path).parent.joinpath("json_controls")
     filename = out_path.joinpath(f"{control.search_primary_key}.json")
-    filename.write_text(json.dumps(control.to_search_json(), indent=0))
+    content = json.dumps(control.to_search_json(), indent=0)
+    build_manifest = manifest.active()
+    if build_manifest is not None:
+        digest = hashlib.sha256(content.encode()).hexdigest()
+        if build_manifest.is_fresh(str(filename), digest):
+            return
+    output.active().write(str(filename), content)
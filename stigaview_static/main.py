@@ -1,20 +1,26 @@
 import argparse
 import datetime
 import logging
+import multiprocessing
 import os
 import pathlib
 import sys
+import time
 import tomllib
 
 from tqdm.auto import tqdm
 
-from stigaview_static import html_output, import_stig, json_output, models
-
-
-def _prep_models() -> None:
-    logging.info("Preparing models")
-    models.Stig.model_rebuild()
-    models.Control.model_rebuild()
+from stigaview_static import (
+    cross_reference,
+    html_output,
+    import_stig,
+    json_output,
+    manifest,
+    models,
+    output,
+    profiling,
+)
+from stigaview_static.cache import DEFAULT_CACHE_DIR, DEFAULT_MAX_SIZE_MB, ParseCache
 
 
 def _log_level_type(value: str) -> int:
@@ -48,7 +54,76 @@ def _parse_args() -> argparse.Namespace:
     parser.add_argument(
         "-l", "--log-level", help="Log level", default="DEBUG", type=_log_level_type
     )
-    return parser.parse_args()
+    parser.add_argument(
+        "--cache-dir",
+        help=f"Directory for cached STIG parses and templates, defaults to {DEFAULT_CACHE_DIR}/",
+        default=DEFAULT_CACHE_DIR,
+    )
+    parser.add_argument(
+        "--cache-size",
+        help=f"Maximum size of the parse cache in MB, defaults to {DEFAULT_MAX_SIZE_MB}",
+        default=DEFAULT_MAX_SIZE_MB,
+        type=int,
+    )
+    parser.add_argument(
+        "--incremental",
+        help="Only write pages whose inputs changed since the last build in the output directory",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--profile",
+        help="Write per-phase and per-product timings and peak RSS to this JSON file",
+    )
+    parser.add_argument(
+        "--profile-cprofile",
+        help="Write cProfile data for the main process and all workers to this file",
+    )
+    parser.add_argument(
+        "--latest-strategy",
+        help="How to publish the newest STIG under latest/, overrides latest_strategy in the config",
+        choices=html_output.LATEST_STRATEGIES,
+    )
+    parser.add_argument(
+        "--no-cache",
+        help="Parse every STIG from XML and compile every template, without reading or writing the caches",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--write-threads",
+        help=f"Threads writing pages in each process, defaults to {output.DEFAULT_WRITE_THREADS}",
+        default=output.DEFAULT_WRITE_THREADS,
+        type=int,
+    )
+    parser.add_argument(
+        "--archive",
+        help="Write the site into this tar file instead of the output directory",
+    )
+    parser.add_argument(
+        "--json-controls",
+        help="Also write every control's search document to json_controls/<id>.json",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--compress-search",
+        help="Gzip the NDJSON search export",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--minify-pages",
+        help="Run minify_html over every page, the default. With --no-minify-pages the "
+        "templates are only stripped of whitespace, which is faster but makes pages larger",
+        action=argparse.BooleanOptionalAction,
+        default=True,
+    )
+    parser.add_argument(
+        "--pipeline",
+        help="Render each product as soon as it is parsed, keeping one product per worker in memory",
+        action="store_true",
+    )
+    args = parser.parse_args()
+    if args.archive and args.incremental:
+        parser.error("--archive can't be used with --incremental")
+    return args
 
 
 def load_config(path: str) -> dict:
@@ -56,8 +131,9 @@ def load_config(path: str) -> dict:
     if not os.path.exists(path):
         logging.error(f"No such file: {path}")
         sys.exit(3)
-    os.environ.setdefault("STIGAVIEW_CONFIG", path)
-    with open(path) as f:
+    # Read by utils.get_config for the site wide template variables
+    os.environ.setdefault("STIGAVIEW_CONFIG_FILE", path)
+    with profiling.phase("config_load"), open(path) as f:
         content = f.read()
         data = tomllib.loads(content)
         return models.StigAViewConfig(**data).model_dump()
@@ -66,37 +142,90 @@ def load_config(path: str) -> dict:
 def main() -> None:
     start_time = datetime.datetime.now(datetime.timezone.utc)
     args = _parse_args()
+    if args.profile or args.profile_cprofile:
+        profiling.enable(args.profile_cprofile)
     logging.basicConfig(
         level=logging.getLevelName(args.log_level),
         format="%(asctime)s - %(levelname)s - %(message)s",
         handlers=[logging.StreamHandler(sys.stderr)],
     )
-    _prep_models()
     config = load_config(args.config)
-    products, srg_dict = process_products(config, args.input)
+    parse_cache = None
+    if not args.no_cache:
+        parse_cache = ParseCache(
+            os.path.join(args.cache_dir, "stigs"), args.cache_size * 1024 * 1024
+        )
+    latest_strategy = args.latest_strategy or config["latest_strategy"]
+    if args.archive:
+        output.activate(output.TarWriter(args.out_dir, args.archive))
+    else:
+        output.activate(output.DirectoryWriter(args.write_threads))
+    json_output.configure(
+        args.json_controls,
+        args.compress_search,
+        config["use_search"] and config["search_backend"] == "offline",
+    )
+    html_output.configure_cache(
+        None if args.no_cache else os.path.join(args.cache_dir, "jinja")
+    )
+    html_output.configure(
+        args.minify_pages,
+        config["onepage_page_size"],
+        config["srg_page_size"],
+        config["search_backend"],
+    )
+    if args.incremental:
+        os.makedirs(args.out_dir, exist_ok=True)
+        manifest.activate(manifest.BuildManifest.load(args.out_dir))
+    if args.pipeline:
+        products, srg_dict, references = process_products_pipelined(
+            config, args.input, args.out_dir, latest_strategy, parse_cache
+        )
+    else:
+        products, srg_dict = process_products(config, args.input, parse_cache)
+        references = cross_reference.build(products)
     html_output.render_stig_index(products, args.out_dir)
     html_output.render_srg_index(srg_dict, args.out_dir)
+    html_output.render_cci_index(references, args.out_dir)
     html_output.write_index(products, args.out_dir)
-    html_output.write_products(products, args.out_dir)
+    html_output.write_products(
+        products,
+        srg_dict,
+        args.out_dir,
+        latest_strategy,
+        references,
+        product_pages=not args.pipeline,
+    )
     json_output.write_product_stig_map(products, args.out_dir)
+    output.active().close()
+    build_manifest = manifest.active()
+    if build_manifest is not None:
+        removed = build_manifest.remove_stale()
+        logging.info(
+            f"Incremental build: {build_manifest.changed()} of "
+            f"{len(build_manifest.current)} pages written, {removed} removed"
+        )
+        build_manifest.save()
     endtime = datetime.datetime.now(datetime.timezone.utc)
     logging.info(f"This script took {endtime-start_time}")
+    if args.profile:
+        profiling.write_report(args.profile, (endtime - start_time).total_seconds())
+    profiling.write_cprofile()
 
 
 def _load_product_config(product_config_path: pathlib.Path) -> dict:
-    with open(product_config_path, "r") as f:
+    with profiling.phase("config_load"), open(product_config_path, "r") as f:
         product_config = tomllib.loads(f.read())
         return models.ProductConfig(**product_config).model_dump()
 
 
-def process_product(
-    product: models.Product, product_path: pathlib.Path, pbar
-) -> tuple[models.Product, dict[str, list]]:
+def _get_product_files(
+    product: models.Product, product_path: pathlib.Path
+) -> list[tuple[pathlib.Path, dict]]:
     product_config_path = product_path.joinpath("product.toml")
     product_config = _load_product_config(product_config_path)
-    stig_files = list(product_path.glob("v*.xml"))
-    srgs: dict[str, list[models.Control]] = dict()
-    for file in stig_files:
+    stig_files = list()
+    for file in product_path.glob("v*.xml"):
         if file.name.startswith("skip"):
             continue
         short_version = file.name.split(".")[0]
@@ -104,45 +233,336 @@ def process_product(
             raise ValueError(
                 f"{product.full_name} doesn't have a config for {short_version}"
             )
-        stig_release_date = product_config["stigs"][short_version]["release_date"]
-        stig, file_srgs = import_stig.import_stig(file, stig_release_date, product)
-        product.stigs.append(stig)
-        srgs.update(file_srgs)
-        pbar.update(1)
-    return product, srgs
+        stig_files.append((file, product_config["stigs"][short_version]))
+    return stig_files
+
 
+def _parse_stig_job(
+    job: tuple[int, pathlib.Path, dict, ParseCache | None],
+) -> tuple[int, list[tuple], bool, dict | None]:
+    index, file, config_entry, parse_cache = job
+    start = time.perf_counter()
+    rows, hit = import_stig.parse_stig_file(file, config_entry, parse_cache)
+    # Product directories are named after the product short name
+    profiling.add_product_time(file.parent.name, "parse", time.perf_counter() - start)
+    return index, rows, hit, profiling.drain()
 
-def _get_total_files(input_path, products):
-    # Count total files to process
-    total_files = 0
+
+def _parse_stig_files(
+    files: list[tuple[pathlib.Path, dict]], parse_cache: ParseCache | None
+) -> list[list[tuple]]:
+    # Hand out the biggest files first so one large STIG doesn't end up
+    # being parsed on its own at the end of the run.
+    jobs = [
+        (index, file, config_entry, parse_cache)
+        for index, (file, config_entry) in enumerate(files)
+    ]
+    jobs.sort(key=lambda job: job[1].stat().st_size, reverse=True)
+    results: list[list[tuple]] = [list() for _ in files]
+    hits = 0
+    with multiprocessing.Pool(
+        multiprocessing.cpu_count(),
+        initializer=profiling.init_worker,
+        initargs=(profiling.settings(),),
+    ) as pool:
+        for index, rows, hit, timings in tqdm(
+            pool.imap_unordered(_parse_stig_job, jobs),
+            total=len(jobs),
+            desc="Processing all STIG files",
+            unit="file",
+        ):
+            results[index] = rows
+            hits += hit
+            profiling.merge(timings)
+        # Let the workers exit on their own so they write their profiles
+        pool.close()
+        pool.join()
+    if parse_cache is not None:
+        logging.info(
+            f"Parse cache: {hits} hits, {len(files) - hits} misses, "
+            f"{parse_cache.evict()} entries evicted"
+        )
+    return results
+
+
+def _all_product_files(
+    products: list[models.Product], input_path: str
+) -> list[list[tuple[pathlib.Path, dict]]]:
+    product_files = list()
     for product in products:
         product_path = pathlib.Path(input_path) / product.short_name
-        if product_path.exists():
-            total_files += len(list(product_path.glob("v*.xml")))
-    return total_files
+        if not product_path.exists():
+            logging.error(
+                f"Unable to find path for {product.short_name} at {product_path}"
+            )
+            exit(4)
+        product_files.append(_get_product_files(product, product_path))
+    return product_files
+
+
+def _merge_srgs(srgs_dict: dict[str, list], srgs: dict[str, list]) -> None:
+    for srg, controls in srgs.items():
+        if srg not in srgs_dict.keys():
+            srgs_dict[srg] = controls
+        else:
+            for control in controls:
+                srgs_dict[srg].append(control)
 
 
 def process_products(
-    config: dict, input_path: str
+    config: dict, input_path: str, parse_cache: ParseCache | None = None
 ) -> tuple[list[models.Product], dict[str, list]]:
     products = models.Product.get_products(config)
-    result = list()
+    product_files = _all_product_files(products, input_path)
+    parsed = iter(
+        _parse_stig_files(
+            [file for files in product_files for file in files], parse_cache
+        )
+    )
     srgs_dict = dict()
-    total_files = _get_total_files(input_path, products)
-    with tqdm(total=total_files, desc="Processing all STIG files", unit="file") as pbar:
-        for product in products:
-            product_path = pathlib.Path(input_path) / product.short_name
-            if not product_path.exists():
-                logging.error(
-                    f"Unable to find path for {product.short_name} at {product_path}"
+    for product, files in zip(products, product_files):
+        srgs: dict[str, list[models.Control]] = dict()
+        for file, config_entry in files:
+            stig, file_srgs = import_stig.build_stig(
+                file, next(parsed), config_entry["release_date"], product
+            )
+            product.stigs.append(stig)
+            srgs.update(file_srgs)
+        _merge_srgs(srgs_dict, srgs)
+    for product in products:
+        product.finalize()
+    return products, srgs_dict
+
+
+# A control as the pages listing controls from every product show it:
+# (STIG index, SRG ID, vulnerability ID, STIG ID, severity, title, CCIs)
+ControlEntry = tuple[int, str, str, str, str, str, list[str]]
+# The SRG, CCI and vulnerability index entries of one product, each control
+# given by its position in the product's control entries
+IndexEntries = tuple[
+    dict[str, list[int]], dict[str, list[int]], dict[str, list[tuple[int, bool]]]
+]
+
+
+def _summarize(product: models.Product) -> models.Product:
+    """The product and its STIGs, without their controls."""
+    summary = models.Product(product.full_name, product.short_name)
+    summary.stigs = [
+        models.Stig(stig.release, stig.version, stig.release_date, summary)
+        for stig in product.stigs
+    ]
+    summary.finalize()
+    return summary
+
+
+def _index_entries(
+    product: models.Product,
+    srgs: dict[str, list[models.Control]],
+    references: cross_reference.CrossReference,
+) -> tuple[list[ControlEntry], IndexEntries]:
+    positions: dict[int, int] = dict()
+    controls: list[ControlEntry] = list()
+    for stig_index, stig in enumerate(product.stigs):
+        for control in stig.controls:
+            positions[id(control)] = len(controls)
+            controls.append(
+                (
+                    stig_index,
+                    control.srg.srg_id,
+                    control.vulnerability_id,
+                    control.disa_stig_id,
+                    control.severity,
+                    control.title,
+                    control.cci,
                 )
-                exit(4)
-            product, srgs = process_product(product, product_path, pbar)
-            for srg, controls in srgs.items():
-                if srg not in srgs_dict.keys():
-                    srgs_dict[srg] = controls
-                else:
-                    for control in controls:
-                        srgs_dict[srg].append(control)
-            result.append(product)
-    return result, srgs_dict
+            )
+    return controls, (
+        {
+            srg_id: [positions[id(control)] for control in srg_controls]
+            for srg_id, srg_controls in srgs.items()
+        },
+        {
+            cci: [positions[id(control)] for control in cci_controls]
+            for cci, cci_controls in references.ccis.items()
+        },
+        {
+            vulnerability_id: [
+                (positions[id(control)], changed) for control, changed in history
+            ]
+            for vulnerability_id, history in references.vulnerabilities.items()
+        },
+    )
+
+
+def _render_product_job(
+    job: tuple[int, models.Product, list[tuple[pathlib.Path, dict]], ParseCache | None],
+) -> tuple[
+    int,
+    models.Product,
+    list[ControlEntry],
+    IndexEntries,
+    int,
+    dict | None,
+    dict | None,
+]:
+    """
+    Parse one product and render its pages in this render worker.
+
+    Only a summary of the product goes back to the parent, with the index
+    entries the pages listing controls from every product need of it.
+    Changed flags only compare releases within a product, so its share of
+    the vulnerability histories can be worked out here.
+    """
+    index, product, files, parse_cache = job
+    srgs: dict[str, list[models.Control]] = dict()
+    hits = 0
+    for file, config_entry in files:
+        start = time.perf_counter()
+        rows, hit = import_stig.parse_stig_file(file, config_entry, parse_cache)
+        profiling.add_product_time(
+            product.short_name, "parse", time.perf_counter() - start
+        )
+        hits += hit
+        stig, file_srgs = import_stig.build_stig(
+            file, rows, config_entry["release_date"], product
+        )
+        product.stigs.append(stig)
+        srgs.update(file_srgs)
+    product.finalize()
+    references = cross_reference.build([product])
+    html_output.render_product(product, references)
+    controls, index_entries = _index_entries(product, srgs, references)
+    manifest.forget_fingerprints()
+    build_manifest = manifest.active()
+    entries = build_manifest.drain() if build_manifest is not None else None
+    return (
+        index,
+        _summarize(product),
+        controls,
+        index_entries,
+        hits,
+        entries,
+        profiling.drain(),
+    )
+
+
+def _merge_index_entries(
+    results: list[tuple[models.Product, list[ControlEntry], IndexEntries]],
+) -> tuple[list[models.Product], dict[str, list], cross_reference.CrossReference]:
+    """
+    Build the products, SRGs and cross references of the pipelined build from
+    the summaries and index entries of each product, in the same order as
+    process_products and cross_reference.build give them.
+    """
+    products = list()
+    srgs_dict: dict[str, list] = dict()
+    ccis: dict[str, list[models.Control]] = dict()
+    vulnerabilities: dict[str, list[tuple[models.Control, bool]]] = dict()
+    srg_models: dict[str, models.Srg] = dict()
+    for product, entries, (srgs, product_ccis, product_vulnerabilities) in results:
+        products.append(product)
+        # Controls without their text, only referenced by the index pages
+        controls = [
+            models.Control(
+                srg=srg_models.setdefault(srg_id, models.Srg(srg_id)),
+                vulnerability_id=vulnerability_id,
+                disa_stig_id=disa_stig_id,
+                severity=severity,
+                title=title,
+                description="",
+                fix="",
+                check="",
+                cci=cci,
+                stig=product.stigs[stig_index],
+            )
+            for (
+                stig_index,
+                srg_id,
+                vulnerability_id,
+                disa_stig_id,
+                severity,
+                title,
+                cci,
+            ) in entries
+        ]
+        _merge_srgs(
+            srgs_dict,
+            {
+                srg_id: [controls[position] for position in positions]
+                for srg_id, positions in srgs.items()
+            },
+        )
+        for cci, positions in product_ccis.items():
+            ccis.setdefault(cci, []).extend(
+                controls[position] for position in positions
+            )
+        for vulnerability_id, history in product_vulnerabilities.items():
+            vulnerabilities.setdefault(vulnerability_id, []).extend(
+                (controls[position], changed) for position, changed in history
+            )
+    # The changelogs were rendered with their products
+    references = cross_reference.CrossReference(
+        dict(sorted(ccis.items())), dict(sorted(vulnerabilities.items())), dict()
+    )
+    return products, srgs_dict, references
+
+
+def process_products_pipelined(
+    config: dict,
+    input_path: str,
+    out_path: str,
+    latest_strategy: str,
+    parse_cache: ParseCache | None = None,
+) -> tuple[list[models.Product], dict[str, list], cross_reference.CrossReference]:
+    """
+    Parse each product in a render worker and render its pages straight away.
+
+    Nothing parsed waits for rendering and each worker holds one product at
+    a time, where process_products holds every product in memory before the
+    first page is rendered. The products returned are summaries without
+    controls, the pages listing controls from every product are rendered
+    after from the index entries sent back with them.
+    """
+    products = models.Product.get_products(config)
+    jobs = [
+        (index, product, files, parse_cache)
+        for index, (product, files) in enumerate(
+            zip(products, _all_product_files(products, input_path))
+        )
+    ]
+    # Biggest products first so a large one isn't left running on its own
+    jobs.sort(
+        key=lambda job: sum(file.stat().st_size for file, _ in job[2]), reverse=True
+    )
+    results: list[tuple] = [tuple() for _ in products]
+    hits = 0
+    build_manifest = manifest.active()
+    with html_output.render_pool(list(), dict(), out_path, latest_strategy) as pool:
+        for (
+            index,
+            product,
+            controls,
+            index_entries,
+            product_hits,
+            entries,
+            timings,
+        ) in tqdm(
+            pool.imap_unordered(_render_product_job, jobs),
+            total=len(jobs),
+            desc="Parsing and rendering products",
+            unit="product",
+        ):
+            results[index] = (product, controls, index_entries)
+            hits += product_hits
+            if build_manifest is not None:
+                build_manifest.update(entries)
+            profiling.merge(timings)
+        pool.close()
+        pool.join()
+    if parse_cache is not None:
+        files = sum(len(job[2]) for job in jobs)
+        logging.info(
+            f"Parse cache: {hits} hits, {files - hits} misses, "
+            f"{parse_cache.evict()} entries evicted"
+        )
+    return _merge_index_entries(results)
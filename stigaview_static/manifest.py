@@ -0,0 +1,204 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import pathlib
+
+from stigaview_static import models
+
+MANIFEST_NAME = ".build-manifest.json"
+TEMPLATES_PATH = "templates"
+
+_active: BuildManifest | None = None
+# Fingerprints are memoized by kind and object id; the object is kept
+# alongside the digest so the id can't be reused while the entry exists.
+_fingerprints: dict[tuple[str, int], tuple[object, str]] = dict()
+
+
+def _hash(*parts: object) -> str:
+    return hashlib.sha256(repr(parts).encode()).hexdigest()
+
+
+def _generator_digest() -> str:
+    """Digest of the code and templates that produce the site."""
+    digest = hashlib.sha256()
+    package_path = pathlib.Path(__file__).parent
+    sources = [(path.name, path) for path in sorted(package_path.glob("*.py"))]
+    templates_path = pathlib.Path(TEMPLATES_PATH)
+    sources.extend(
+        (path.relative_to(templates_path).as_posix(), path)
+        for path in sorted(templates_path.rglob("*"))
+        if path.is_file()
+    )
+    for name, source in sources:
+        digest.update(name.encode())
+        digest.update(source.read_bytes())
+    return digest.hexdigest()
+
+
+def _memoized(kind: str, obj: object, compute) -> str:
+    entry = _fingerprints.get((kind, id(obj)))
+    if entry is None:
+        entry = (obj, compute(obj))
+        _fingerprints[(kind, id(obj))] = entry
+    return entry[1]
+
+
+def _stig_header(stig: models.Stig) -> str:
+    # Everything a page shows about a STIG apart from its controls.
+    product = stig.product
+    return _memoized(
+        "stig",
+        stig,
+        lambda _: _hash(
+            product.short_name,
+            product.full_name,
+            product.latest_stig.short_version,
+            stig.version,
+            stig.release,
+            stig.release_date,
+        ),
+    )
+
+
+def _control_fingerprint(control: models.Control) -> str:
+    return _memoized(
+        "control",
+        control,
+        lambda c: _hash(
+            _stig_header(c.stig),
+            c.srg.srg_id,
+            c.vulnerability_id,
+            c.disa_stig_id,
+            c.severity,
+            c.title,
+            c.description,
+            c.fix,
+            c.check,
+            list(c.cci),
+        ),
+    )
+
+
+def forget_fingerprints() -> None:
+    """Drop the memoized fingerprints and the models they keep alive."""
+    _fingerprints.clear()
+
+
+def fingerprint(value: object) -> str:
+    """Stable digest of the model data a page is rendered from."""
+    if isinstance(value, models.Control):
+        return _control_fingerprint(value)
+    if isinstance(value, models.Stig):
+        return _hash(
+            _stig_header(value),
+            [_control_fingerprint(control) for control in value.controls],
+        )
+    if isinstance(value, models.Product):
+        return _hash(
+            value.short_name,
+            value.full_name,
+            [fingerprint(stig) for stig in value.stigs],
+        )
+    if isinstance(value, (list, tuple)):
+        return _hash([fingerprint(item) for item in value])
+    if isinstance(value, dict):
+        return _hash([(key, fingerprint(item)) for key, item in value.items()])
+    return _hash(value)
+
+
+class BuildManifest:
+    """
+    Digests of every page written by the previous and the current build.
+
+    Paths are stored relative to the output directory. A page whose digest
+    matches the previous build is left alone on disk, and pages that the
+    current build no longer produces are removed at the end.
+    """
+
+    def __init__(self, out_path: str, generator: str, previous: dict[str, str]):
+        self.out_path = os.path.normpath(out_path)
+        self.generator = generator
+        self.previous = previous
+        self.current: dict[str, str] = dict()
+
+    @classmethod
+    def load(cls, out_path: str) -> BuildManifest:
+        generator = _generator_digest()
+        manifest_path = os.path.join(out_path, MANIFEST_NAME)
+        previous = dict()
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                data = json.load(f)
+            if data.get("generator") == generator:
+                previous = data["pages"]
+            else:
+                logging.info("Site generator changed, rebuilding every page")
+        return cls(out_path, generator, previous)
+
+    def save(self) -> None:
+        manifest_path = os.path.join(self.out_path, MANIFEST_NAME)
+        with open(manifest_path, "w") as f:
+            json.dump({"generator": self.generator, "pages": self.current}, f)
+
+    def _key(self, path: str) -> str:
+        return os.path.relpath(path, self.out_path)
+
+    def page_digest(self, template: str, context: dict) -> str:
+        return _hash(
+            template,
+            sorted((key, fingerprint(value)) for key, value in context.items()),
+        )
+
+    def is_fresh(self, path: str, digest: str) -> bool:
+        """Record the digest for path and report whether it is unchanged."""
+        key = self._key(path)
+        # Some STIGs reuse a STIG ID, so the same path can be written more
+        # than once per build; the last write has to win like a full build.
+        written = key in self.current
+        self.current[key] = digest
+        return not written and self.previous.get(key) == digest
+
+    def digest_of(self, path: str) -> str | None:
+        return self.current.get(self._key(path))
+
+    def changed(self) -> int:
+        return sum(
+            1
+            for key, digest in self.current.items()
+            if self.previous.get(key) != digest
+        )
+
+    def drain(self) -> dict[str, str]:
+        entries = self.current
+        self.current = dict()
+        return entries
+
+    def update(self, entries: dict[str, str]) -> None:
+        self.current.update(entries)
+
+    def remove_stale(self) -> int:
+        removed = 0
+        for key in self.previous.keys() - self.current.keys():
+            path = os.path.join(self.out_path, key)
+            if os.path.lexists(path):
+                os.remove(path)
+                removed += 1
+            parent = os.path.dirname(path)
+            while parent != self.out_path and os.path.isdir(parent):
+                if os.listdir(parent):
+                    break
+                os.rmdir(parent)
+                parent = os.path.dirname(parent)
+        return removed
+
+
+def activate(manifest: BuildManifest | None) -> None:
+    global _active
+    _active = manifest
+
+
+def active() -> BuildManifest | None:
+    return _active
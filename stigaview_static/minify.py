@@ -0,0 +1,129 @@
+"""
+Whitespace and comment stripping for the Jinja templates, done once when a
+template is loaded instead of running minify_html over every rendered page.
+
+Only whitespace minify_html would also remove goes: runs of whitespace in
+text become one space, and whitespace is dropped between block level tags
+and at the start and end of their content. Jinja tags and the contents of
+pre, textarea, script and style are kept as they are, and what {{ }} or an
+include renders counts as text.
+"""
+
+import re
+
+from jinja2 import FileSystemLoader
+
+_TOKEN = re.compile(
+    r"(?P<jinja>\{%.*?%\}|\{\{.*?\}\}|\{#.*?#\})"
+    r"|(?P<comment><!--(?!\[if).*?-->)"
+    r"|(?P<raw><(?P<raw_name>pre|textarea|script|style)\b.*?</(?P=raw_name)\s*>)"
+    r"|(?P<tag><(?P<closing>/?)(?P<name>[a-zA-Z][a-zA-Z0-9-]*)"
+    r"(?:[^>{]|\{\{.*?\}\}|\{%.*?%\}|\{)*>)"
+    r"|(?P<doctype><!doctype[^>]*>)",
+    re.DOTALL | re.IGNORECASE,
+)
+_TAG_PART = re.compile(r"\"[^\"]*\"|'[^']*'|\{\{.*?\}\}|\{%.*?%\}|\s+|[^\s\"'{]+|\{")
+_INCLUDE = re.compile(r"\{%-?\s*include\b")
+_WHITESPACE = re.compile(r"\s+")
+# Elements the browser lays out as blocks, or that aren't rendered at all
+BLOCK_ELEMENTS = frozenset("""
+    address article aside blockquote body br dd details dialog div dl dt
+    fieldset figcaption figure footer form h1 h2 h3 h4 h5 h6 head header hr
+    html li link main meta nav ol option p section table tbody td tfoot th
+    thead title tr ul
+    """.split())
+VOID_ELEMENTS = frozenset("br hr link meta".split())
+
+# Token kinds
+_TEXT = "text"
+# Renders text: {{ }} and include
+_OUTPUT = "output"
+# Renders nothing in place: every other Jinja tag
+_STATEMENT = "statement"
+_INLINE = "inline"
+_BLOCK_OPEN = "block_open"
+_BLOCK_CLOSE = "block_close"
+_BLOCK_VOID = "block_void"
+_BLOCK = (_BLOCK_OPEN, _BLOCK_CLOSE, _BLOCK_VOID)
+
+
+def _collapse_tag(tag: str) -> str:
+    """Collapse whitespace between the attributes of a tag, not inside them."""
+    parts = [" " if part.isspace() else part for part in _TAG_PART.findall(tag[1:-1])]
+    return f"<{''.join(parts).strip()}>".replace(" />", "/>")
+
+
+def _tag_kind(match: re.Match) -> str:
+    name = match["name"].lower()
+    if name not in BLOCK_ELEMENTS:
+        return _INLINE
+    if name in VOID_ELEMENTS:
+        return _BLOCK_VOID
+    return _BLOCK_CLOSE if match["closing"] else _BLOCK_OPEN
+
+
+def _tokens(source: str) -> list[tuple[str, str]]:
+    """Split source into (kind, text) tokens."""
+    tokens = list()
+    position = 0
+    for match in _TOKEN.finditer(source):
+        if match.start() > position:
+            tokens.append((_TEXT, source[position : match.start()]))  # noqa: E203
+        position = match.end()
+        if match["jinja"]:
+            output = match[0].startswith("{{") or _INCLUDE.match(match[0])
+            tokens.append((_OUTPUT if output else _STATEMENT, match[0]))
+        elif match["comment"]:
+            continue
+        elif match["raw"]:
+            tokens.append((_INLINE, match[0]))
+        elif match["tag"]:
+            tokens.append((_tag_kind(match), _collapse_tag(match[0])))
+        else:
+            tokens.append((_BLOCK_VOID, match[0]))
+    if position < len(source):
+        tokens.append((_TEXT, source[position:]))
+    return tokens
+
+
+def _neighbour(tokens: list[tuple[str, str]], index: int, step: int) -> str | None:
+    """
+    Kind of the nearest token that renders something, looking past statements
+    and the whitespace between them.
+    """
+    index += step
+    while 0 <= index < len(tokens):
+        kind, text = tokens[index]
+        if kind != _STATEMENT and not (kind == _TEXT and text.isspace()):
+            return kind
+        index += step
+    return None
+
+
+def minify_template(source: str) -> str:
+    tokens = _tokens(source)
+    result = list()
+    for index, (kind, text) in enumerate(tokens):
+        if kind != _TEXT:
+            result.append(text)
+            continue
+        text = _WHITESPACE.sub(" ", text)
+        before = _neighbour(tokens, index, -1)
+        after = _neighbour(tokens, index, 1)
+        if text == " " and _OUTPUT not in (before, after):
+            if before in _BLOCK or after in _BLOCK:
+                continue
+        if text.startswith(" ") and before == _BLOCK_OPEN:
+            text = text[1:]
+        if text.endswith(" ") and after == _BLOCK_CLOSE:
+            text = text[:-1]
+        result.append(text)
+    return "".join(result)
+
+
+class MinifyingLoader(FileSystemLoader):
+    """FileSystemLoader that hands Jinja the stripped template source."""
+
+    def get_source(self, environment, template):
+        source, filename, uptodate = super().get_source(environment, template)
+        return minify_template(source), filename, uptodate
@@ -1,25 +1,32 @@
 from __future__ import annotations
 
+import dataclasses
 import datetime
 import logging
 import pathlib
 import tomllib
-from typing import Dict, List
+from typing import Dict, List, Literal
 
-from pydantic import BaseModel
+from pydantic import BaseModel, PositiveInt
 
+# The STIG data models are plain slotted dataclasses: there are tens of
+# thousands of controls per build and they are only ever created from parsed
+# XML, so pydantic validation is kept to the config models at the bottom.
 
-class Srg(BaseModel):
+
+@dataclasses.dataclass(slots=True, eq=False)
+class Srg:
     srg_id: str
     title: str | None = None
-    controls: list[Control] = []
+    controls: list[Control] = dataclasses.field(default_factory=list)
 
     @property
     def url(self) -> str:
         return f"/srgs/{self.srg_id}"
 
 
-class Control(BaseModel):
+@dataclasses.dataclass(slots=True, eq=False)
+class Control:
     srg: Srg
     vulnerability_id: str
     disa_stig_id: str
@@ -67,12 +74,19 @@ class Control(BaseModel):
         }
 
 
-class Stig(BaseModel):
+@dataclasses.dataclass(slots=True, eq=False)
+class Stig:
     release: int
     version: int
     release_date: datetime.date
-    controls: List[Control] = []
     product: Product
+    # Controls in the order of the XCCDF file
+    controls: List[Control] = dataclasses.field(default_factory=list)
+    # Set by finalize once every control has been imported
+    sorted_controls: List[Control] = dataclasses.field(default_factory=list, init=False)
+    controls_by_id: Dict[str, Control] = dataclasses.field(
+        default_factory=dict, init=False
+    )
 
     @property
     def short_version(self) -> str:
@@ -85,6 +99,14 @@ class Stig(BaseModel):
     def __repr__(self):
         return f"<Stig {self.short_version}>"
 
+    def finalize(self) -> None:
+        """Sort the controls by STIG ID and index them by STIG ID."""
+        self.sorted_controls = sorted(self.controls)
+        self.controls_by_id = dict()
+        for control in self.sorted_controls:
+            # A reused STIG ID keeps the last control, like its page does
+            self.controls_by_id[control.disa_stig_id] = control
+
     def __le__(self, other):
         return self.release_date < other.release_date
 
@@ -92,10 +114,13 @@ class Stig(BaseModel):
         return self.release_date > other.release_date
 
 
-class Product(BaseModel):
+@dataclasses.dataclass(slots=True, eq=False)
+class Product:
     full_name: str
     short_name: str
-    stigs: list[Stig] = []
+    stigs: list[Stig] = dataclasses.field(default_factory=list)
+    # Set by finalize once every STIG has been imported
+    latest_stig: Stig | None = dataclasses.field(default=None, init=False)
 
     @staticmethod
     def get_products(config: dict) -> list[Product]:
@@ -117,8 +142,16 @@ class Product(BaseModel):
                 products.append(p)
         return products
 
-    def sort_stigs(self):
+    def finalize(self) -> None:
+        """
+        Sort the STIGs oldest first and finalize each of them.
+
+        Called once after import, the models are treated as read only after.
+        """
         self.stigs = sorted(self.stigs)
+        self.latest_stig = self.stigs[-1] if self.stigs else None
+        for stig in self.stigs:
+            stig.finalize()
 
     def __repr__(self):
         return repr((self.short_name, self.full_name))
@@ -133,11 +166,6 @@ class Product(BaseModel):
     def url(self) -> str:
         return f"/products/{self.short_name}"
 
-    @property
-    def latest_stig(self) -> Stig:
-        self.sort_stigs()
-        return self.stigs[-1]
-
 
 class ProductConfig(BaseModel):
     full_name: str
@@ -145,8 +173,21 @@ class ProductConfig(BaseModel):
     stigs: Dict[str, Dict[str, datetime.date]]
 
 
+LatestStrategy = Literal["copy", "hardlink", "symlink", "redirect", "render"]
+# meilisearch queries the hosted search server, offline searches the
+# search/index shards in the browser
+SearchBackend = Literal["meilisearch", "offline"]
+
+
 class StigAViewConfig(BaseModel):
     title: str
     site_path: str
     products_path: str
     use_search: bool
+    latest_strategy: LatestStrategy = "copy"
+    search_backend: SearchBackend = "meilisearch"
+    # Also write the one page STIG and SRG views in pages of this many
+    # controls, next to the full views. Later pages of a one page STIG are
+    # loaded as the reader scrolls.
+    onepage_page_size: PositiveInt | None = None
+    srg_page_size: PositiveInt | None = None
@@ -0,0 +1,313 @@
+from __future__ import annotations
+
+import concurrent.futures
+import io
+import logging
+import multiprocessing.util
+import os
+import pathlib
+import re
+import shutil
+import tarfile
+import tempfile
+import threading
+import time
+from typing import Iterable
+
+from stigaview_static import profiling
+
+DEFAULT_WRITE_THREADS = 4
+# Pages waiting in memory for a write thread, per process
+MAX_PENDING_WRITES = 256
+WRITE_BUFFER_SIZE = 1024 * 1024
+# <pool>.<pid> after the archive name
+_SHARD_SUFFIX = re.compile(r"\d+\.\d+")
+
+
+class DirectoryWriter:
+    """
+    Write the site to a directory tree.
+
+    Writes are handed to a small thread pool so rendering carries on while
+    pages hit the disk; call flush to wait for them. With threads=0 every
+    write happens inline. Directories are created once per process, and
+    makedirs can create the whole tree up front before workers start.
+    """
+
+    def __init__(self, threads: int = DEFAULT_WRITE_THREADS):
+        self.threads = threads
+        self._directories: set[str] = set()
+        self._executor: concurrent.futures.ThreadPoolExecutor | None = None
+        self._pending: dict[str, concurrent.futures.Future] = dict()
+        self._slots = threading.BoundedSemaphore(MAX_PENDING_WRITES)
+
+    def __getstate__(self) -> dict:
+        return {"threads": self.threads, "directories": self._directories}
+
+    def __setstate__(self, state: dict) -> None:
+        self.__init__(state["threads"])
+        self._directories = state["directories"]
+
+    def init_worker(self) -> None:
+        """Drop the thread pool inherited from the parent, its threads don't fork."""
+        self._executor = None
+        self._pending = dict()
+        self._slots = threading.BoundedSemaphore(MAX_PENDING_WRITES)
+
+    def makedirs(self, paths: Iterable[str]) -> None:
+        for path in paths:
+            self._makedirs(path)
+
+    def _makedirs(self, path: str) -> None:
+        if path not in self._directories:
+            os.makedirs(path, exist_ok=True)
+            self._directories.add(path)
+
+    def _submit(self, path: str, task, *args, source: str | None = None) -> None:
+        """
+        Run task for path on the thread pool.
+
+        It runs after any earlier task for the same path, so the last write
+        wins, and after the task writing source if there is one.
+        """
+        if not self.threads:
+            task(*args)
+            return
+        if self._executor is None:
+            self._executor = concurrent.futures.ThreadPoolExecutor(self.threads)
+        after = (self._pending.get(path), self._pending.get(source))
+        self._slots.acquire()
+        future = self._executor.submit(self._run_after, after, task, *args)
+        future.add_done_callback(lambda _: self._slots.release())
+        self._pending[path] = future
+
+    @staticmethod
+    def _run_after(after: tuple, task, *args) -> None:
+        # Tasks start in submission order, so the ones waited on here are
+        # already running or done and this can't deadlock the pool.
+        for future in after:
+            if future is not None:
+                future.result()
+        task(*args)
+
+    def _replace(self, target: str) -> None:
+        self._makedirs(os.path.dirname(target))
+        if os.path.lexists(target):
+            # Never write through a link left behind by an earlier build
+            os.remove(target)
+
+    def write(self, path: str, content: str | bytes) -> None:
+        self._submit(path, self._write, path, content)
+
+    def _write(self, path: str, content: str | bytes) -> None:
+        self._makedirs(os.path.dirname(path))
+        mode = "wb" if isinstance(content, bytes) else "w"
+        with (
+            profiling.phase("file_write"),
+            open(path, mode, buffering=WRITE_BUFFER_SIZE) as f,
+        ):
+            f.write(content)
+
+    def write_stream(self, path: str, chunks: Iterable[str | bytes]) -> None:
+        """
+        Write chunks of text or bytes to path as they are produced.
+
+        This happens in the calling thread so a large page never sits in
+        memory waiting for a write thread. Pending writes finish first, as
+        one of them may be a copy still reading the file at path.
+        """
+        self.flush()
+        self._makedirs(os.path.dirname(path))
+        # Only the writes are timed, not producing the chunks
+        seconds = 0.0
+        with open(path, "wb", buffering=WRITE_BUFFER_SIZE) as f:
+            for chunk in chunks:
+                start = time.perf_counter()
+                f.write(chunk if isinstance(chunk, bytes) else chunk.encode())
+                seconds += time.perf_counter() - start
+        profiling.record("file_write", seconds)
+
+    def replace(self, path: str, content: str | bytes) -> None:
+        """Like write, but unlink whatever is at path first."""
+        self._submit(path, self._replace_content, path, content)
+
+    def _replace_content(self, path: str, content: str | bytes) -> None:
+        self._replace(path)
+        self._write(path, content)
+
+    def copy(self, source: str, target: str) -> None:
+        self._submit(target, self._copy, source, target, source=source)
+
+    def _copy(self, source: str, target: str) -> None:
+        self._replace(target)
+        shutil.copy2(source, target)
+
+    def link(self, source: str, target: str) -> None:
+        """Hardlink target to source, copying where the filesystem can't link."""
+        self._submit(target, self._link, source, target, source=source)
+
+    def _link(self, source: str, target: str) -> None:
+        self._replace(target)
+        try:
+            os.link(source, target)
+        except OSError:
+            shutil.copy2(source, target)
+
+    def symlink(self, source: str, target: str) -> None:
+        self._submit(target, self._symlink, source, target)
+
+    def _symlink(self, source: str, target: str) -> None:
+        self._replace(target)
+        os.symlink(os.path.relpath(source, os.path.dirname(target)), target)
+
+    def flush(self) -> None:
+        """Wait for every pending write, raising the first error."""
+        pending = self._pending
+        self._pending = dict()
+        for future in pending.values():
+            future.result()
+
+    def before_fork(self) -> None:
+        """Finish every write and stop the threads, forking with them isn't safe."""
+        self.flush()
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def close(self) -> None:
+        self.before_fork()
+
+
+class TarWriter:
+    """
+    Write the site into a single tar archive instead of a directory.
+
+    Every render worker appends to its own shard next to the archive, and
+    close merges the shards into it once the workers have exited. Shards are
+    named after the pool and the worker pid, as a later pool in the same
+    build may reuse a pid. Copies and hardlinks are stored as hard link
+    members, which extract to the same files.
+    """
+
+    def __init__(self, out_path: str, archive_path: str, pool: int = 0):
+        self.out_path = out_path
+        self.archive_path = archive_path
+        self._pool = pool
+        self._tar: tarfile.TarFile | None = None
+
+    def __getstate__(self) -> dict:
+        return {
+            "out_path": self.out_path,
+            "archive_path": self.archive_path,
+            "pool": self._pool,
+        }
+
+    def __setstate__(self, state: dict) -> None:
+        self.__init__(state["out_path"], state["archive_path"], state["pool"])
+
+    def _shard_path(self, pid: int) -> str:
+        return f"{self.archive_path}.{self._pool}.{pid}"
+
+    def init_worker(self) -> None:
+        self._tar = None
+        self._open(self._shard_path(os.getpid()))
+        # Pool workers run their finalizers when they exit after Pool.close
+        multiprocessing.util.Finalize(self, self._tar.close, exitpriority=10)
+
+    def _open(self, path: str) -> None:
+        fileobj = open(path, "wb", buffering=WRITE_BUFFER_SIZE)
+        self._tar = tarfile.open(fileobj=fileobj, mode="w")
+        # TarFile doesn't close a file object it was given
+        multiprocessing.util.Finalize(self._tar, fileobj.close, exitpriority=5)
+
+    def _name(self, path: str) -> str:
+        return pathlib.PurePath(os.path.relpath(path, self.out_path)).as_posix()
+
+    def _member(self, path: str, member_type: bytes) -> tarfile.TarInfo:
+        info = tarfile.TarInfo(self._name(path))
+        info.type = member_type
+        info.mtime = int(time.time())
+        info.mode = 0o777 if member_type == tarfile.SYMTYPE else 0o644
+        return info
+
+    def makedirs(self, paths: Iterable[str]) -> None:
+        pass
+
+    def write(self, path: str, content: str | bytes) -> None:
+        if self._tar is None:
+            self._open(self.archive_path)
+        data = content if isinstance(content, bytes) else content.encode()
+        info = self._member(path, tarfile.REGTYPE)
+        info.size = len(data)
+        with profiling.phase("file_write"):
+            self._tar.addfile(info, io.BytesIO(data))
+
+    replace = write
+
+    def write_stream(self, path: str, chunks: Iterable[str | bytes]) -> None:
+        # The member size goes before the data, so spool the page first,
+        # to disk once it outgrows the buffer
+        if self._tar is None:
+            self._open(self.archive_path)
+        with tempfile.SpooledTemporaryFile(WRITE_BUFFER_SIZE) as spool:
+            for chunk in chunks:
+                spool.write(chunk if isinstance(chunk, bytes) else chunk.encode())
+            info = self._member(path, tarfile.REGTYPE)
+            info.size = spool.tell()
+            spool.seek(0)
+            with profiling.phase("file_write"):
+                self._tar.addfile(info, spool)
+
+    def link(self, source: str, target: str) -> None:
+        info = self._member(target, tarfile.LNKTYPE)
+        info.linkname = self._name(source)
+        self._tar.addfile(info)
+
+    copy = link
+
+    def symlink(self, source: str, target: str) -> None:
+        info = self._member(target, tarfile.SYMTYPE)
+        info.linkname = os.path.relpath(source, os.path.dirname(target))
+        self._tar.addfile(info)
+
+    def flush(self) -> None:
+        pass
+
+    def before_fork(self) -> None:
+        if self._tar is not None:
+            self._tar.fileobj.flush()
+        self._pool += 1
+
+    def close(self) -> None:
+        """Close the archive, merging in the shards written by workers."""
+        if self._tar is None:
+            self._open(self.archive_path)
+        directory = os.path.dirname(os.path.abspath(self.archive_path))
+        prefix = f"{os.path.basename(self.archive_path)}."
+        for name in sorted(os.listdir(directory)):
+            if not name.startswith(prefix) or not _SHARD_SUFFIX.fullmatch(
+                name.removeprefix(prefix)
+            ):
+                continue
+            shard_path = os.path.join(directory, name)
+            with tarfile.open(shard_path) as shard:
+                for member in shard:
+                    self._tar.addfile(member, shard.extractfile(member))
+            os.remove(shard_path)
+        fileobj = self._tar.fileobj
+        self._tar.close()
+        fileobj.close()
+        self._tar = None
+        logging.info(f"Wrote the site to {self.archive_path}")
+
+
+_active: DirectoryWriter | TarWriter = DirectoryWriter(threads=0)
+
+
+def activate(writer: DirectoryWriter | TarWriter) -> None:
+    global _active
+    _active = writer
+
+
+def active() -> DirectoryWriter | TarWriter:
+    return _active
@@ -0,0 +1,182 @@
+import collections
+import contextlib
+import cProfile
+import itertools
+import json
+import logging
+import multiprocessing.util
+import os
+import pstats
+import resource
+import sys
+import threading
+import time
+from typing import Iterator
+
+# Phase timings are inclusive, so a phase nested in another (for example
+# description_escaping inside xml_parse) is also counted in the outer one.
+_enabled = False
+_cprofile_path: str | None = None
+_profiler: cProfile.Profile | None = None
+# Numbers each pool of workers, a later pool may reuse the pid of a worker
+_pools = itertools.count(1)
+# Write threads record phases too
+_lock = threading.Lock()
+_seconds: collections.Counter[str] = collections.Counter()
+_calls: collections.Counter[str] = collections.Counter()
+_products: dict[str, collections.Counter[str]] = collections.defaultdict(
+    collections.Counter
+)
+
+
+def enable(cprofile_path: str | None = None) -> None:
+    global _enabled, _cprofile_path, _profiler
+    _enabled = True
+    _cprofile_path = cprofile_path
+    if cprofile_path is not None:
+        _profiler = cProfile.Profile()
+        _profiler.enable()
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def settings() -> tuple[bool, str | None, int]:
+    """Settings for the workers of a new pool."""
+    return _enabled, _cprofile_path, next(_pools)
+
+
+def init_worker(worker_settings: tuple[bool, str | None, int]) -> None:
+    """
+    Pool initializer, start profiling in a worker if the parent is.
+
+    The worker's cProfile data is written once, when it exits after the
+    pool is closed, for write_cprofile to merge.
+    """
+    global _profiler
+    _seconds.clear()
+    _calls.clear()
+    _products.clear()
+    if _profiler is not None:
+        # A forked worker inherits the parent's profiler
+        _profiler.disable()
+        _profiler = None
+    worker_enabled, cprofile_path, pool = worker_settings
+    if worker_enabled:
+        enable(cprofile_path)
+    if _profiler is not None:
+        multiprocessing.util.Finalize(
+            None,
+            _dump_worker,
+            args=(f"{cprofile_path}.{pool}.{os.getpid()}",),
+            exitpriority=0,
+        )
+
+
+def _dump_worker(path: str) -> None:
+    if _profiler is not None:
+        _profiler.disable()
+        _profiler.dump_stats(path)
+
+
+def record(name: str, seconds: float) -> None:
+    """Count one call of a phase timed by the caller."""
+    if _enabled:
+        with _lock:
+            _seconds[name] += seconds
+            _calls[name] += 1
+
+
+@contextlib.contextmanager
+def _timed(name: str) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start)
+
+
+_NOT_TIMED = contextlib.nullcontext()
+
+
+def phase(name: str) -> contextlib.AbstractContextManager:
+    """Time a block under name; a shared no-op when profiling is off."""
+    if not _enabled:
+        return _NOT_TIMED
+    return _timed(name)
+
+
+def add_product_time(product: str, stage: str, seconds: float) -> None:
+    if _enabled:
+        _products[product][stage] += seconds
+
+
+def drain() -> dict | None:
+    """Collect and reset the timings of a worker so the parent can merge them."""
+    if not _enabled:
+        return None
+    with _lock:
+        timings = {
+            "seconds": dict(_seconds),
+            "calls": dict(_calls),
+            "products": {name: dict(stages) for name, stages in _products.items()},
+        }
+        _seconds.clear()
+        _calls.clear()
+    _products.clear()
+    return timings
+
+
+def merge(timings: dict | None) -> None:
+    if timings is None:
+        return
+    _seconds.update(timings["seconds"])
+    _calls.update(timings["calls"])
+    for name, stages in timings["products"].items():
+        _products[name].update(stages)
+
+
+def _peak_rss_mb(who: int) -> float:
+    peak = resource.getrusage(who).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes everywhere else
+    if sys.platform == "darwin":
+        return peak / 1024 / 1024
+    return peak / 1024
+
+
+def write_report(path: str, wall_seconds: float) -> None:
+    report = {
+        "wall_seconds": wall_seconds,
+        "peak_rss_mb": {
+            "main": _peak_rss_mb(resource.RUSAGE_SELF),
+            "workers": _peak_rss_mb(resource.RUSAGE_CHILDREN),
+        },
+        "phases": {
+            name: {"seconds": _seconds[name], "calls": _calls[name]}
+            for name in sorted(_seconds, key=_seconds.get, reverse=True)
+        },
+        "products": {name: dict(_products[name]) for name in sorted(_products)},
+    }
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+    logging.info(f"Wrote profile report to {path}")
+
+
+def write_cprofile() -> None:
+    """Merge the main process and worker cProfile data into one pstats file."""
+    if _profiler is None or _cprofile_path is None:
+        return
+    _profiler.disable()
+    stats = pstats.Stats(_profiler)
+    directory = os.path.dirname(os.path.abspath(_cprofile_path))
+    prefix = f"{os.path.basename(_cprofile_path)}."
+    for name in os.listdir(directory):
+        # Worker dumps are named <path>.<pool>.<pid>
+        suffix = name[len(prefix) :].split(".")  # noqa: E203
+        if name.startswith(prefix) and all(part.isdigit() for part in suffix):
+            worker_dump = os.path.join(directory, name)
+            stats.add(worker_dump)
+            os.remove(worker_dump)
+    stats.dump_stats(_cprofile_path)
+    logging.info(f"Wrote cProfile data to {_cprofile_path}")
@@ -0,0 +1,105 @@
+"""
+Inverted index for searching the site in the browser without a search server.
+
+Each product gets one shard under search/index/, loaded by search.js when
+it is first needed. A shard is compact JSON:
+
+    docs      [path, title, STIG version, severity, STIG ID] per control,
+              newest STIG first
+    terms     sorted tokens of the title, IDs, CCIs and SRG of the controls
+    postings  for each term, the indexes of the docs it appears in, delta
+              encoded so most entries are one or two digits
+    prefixes  first two characters of a term to the [start, end) range of
+              terms that begin with them, for prefix matching
+"""
+
+import json
+import os
+import re
+
+from stigaview_static import manifest, models, output, profiling
+
+INDEX_VERSION = 1
+SEARCH_INDEX_DIR = os.path.join("search", "index")
+PREFIX_LENGTH = 2
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+# Words in nearly every title that would only make the shards bigger
+STOP_WORDS = frozenset(
+    "a an and are be by for from in is it its must not of on or the that to with".split()
+)
+
+
+def tokenize(text: str) -> set[str]:
+    """Same rules as tokenize in search.js, both sides have to agree."""
+    return {
+        token
+        for token in _TOKEN.findall(text.lower())
+        if len(token) >= PREFIX_LENGTH and token not in STOP_WORDS
+    }
+
+
+def _control_tokens(control: models.Control) -> set[str]:
+    fields = [
+        control.title,
+        control.disa_stig_id,
+        control.vulnerability_id,
+        control.srg.srg_id,
+        *control.cci,
+    ]
+    return set().union(*(tokenize(field) for field in fields))
+
+
+def build_index(product: models.Product) -> dict:
+    docs = list()
+    term_docs: dict[str, list[int]] = dict()
+    for stig in reversed(product.stigs):
+        # A reused STIG ID keeps the last control, like its page does
+        for control in stig.controls_by_id.values():
+            doc = len(docs)
+            docs.append(
+                [
+                    control.url,
+                    control.title,
+                    stig.short_version,
+                    control.severity,
+                    control.disa_stig_id,
+                ]
+            )
+            for token in _control_tokens(control):
+                term_docs.setdefault(token, []).append(doc)
+    terms = sorted(term_docs)
+    postings = list()
+    prefixes: dict[str, list[int]] = dict()
+    for position, term in enumerate(terms):
+        previous = 0
+        deltas = list()
+        for doc in term_docs[term]:
+            deltas.append(doc - previous)
+            previous = doc
+        postings.append(deltas)
+        prefix_range = prefixes.setdefault(term[:PREFIX_LENGTH], [position, position])
+        prefix_range[1] = position + 1
+    return {
+        "version": INDEX_VERSION,
+        "docs": docs,
+        "terms": terms,
+        "postings": postings,
+        "prefixes": prefixes,
+    }
+
+
+def index_path(out_path: str, product: models.Product) -> str:
+    return os.path.join(out_path, SEARCH_INDEX_DIR, f"{product.short_name}.json")
+
+
+def write_search_index(product: models.Product, out_path: str) -> None:
+    with profiling.phase("search_index"):
+        path = index_path(out_path, product)
+        build_manifest = manifest.active()
+        if build_manifest is not None and build_manifest.is_fresh(
+            path, manifest.fingerprint(product)
+        ):
+            return
+        content = json.dumps(build_index(product), separators=(",", ":"))
+        output.active().write(path, content)
@@ -1,7 +1,10 @@
 import functools
+import multiprocessing
+import multiprocessing.context
 import os
 import pathlib
 import subprocess
+import sys
 import tomllib
 
 
@@ -21,8 +24,22 @@ def get_git_revision_short_hash() -> str:
     )
 
 
+@functools.cache
 def get_config() -> dict:
     config_file = pathlib.Path(
         os.environ.get("STIGAVIEW_CONFIG_FILE", "stigaview.toml")
     )
     return tomllib.loads(config_file.read_text())
+
+
+def get_pool_context() -> multiprocessing.context.BaseContext:
+    """
+    Prefer fork on Linux so workers share already parsed data copy-on-write.
+
+    Other platforms keep their default start method, where fork is either
+    missing or unsafe, and pool initializer arguments are pickled once per
+    worker instead.
+    """
+    if sys.platform.startswith("linux"):
+        return multiprocessing.get_context("fork")
+    return multiprocessing.get_context()
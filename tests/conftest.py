@@ -0,0 +1,32 @@
+import pathlib
+
+import pytest
+
+from stigaview_static import main, models
+
+ROOT = pathlib.Path(__file__).parent.parent
+# Small products from products/, one of them with several releases
+PRODUCTS = ("srg-firewall", "appc_as")
+
+
+@pytest.fixture(scope="session", autouse=True)
+def repo_root():
+    # Templates and stigaview.toml are found relative to the working directory
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.chdir(ROOT)
+        yield
+
+
+@pytest.fixture(scope="session")
+def site(tmp_path_factory) -> tuple[list[models.Product], dict]:
+    """The parsed PRODUCTS and their SRGs."""
+    products_path = tmp_path_factory.mktemp("products")
+    for name in PRODUCTS:
+        products_path.joinpath(name).symlink_to(ROOT / "products" / name)
+    config = models.StigAViewConfig(
+        title="STIG A View Static",
+        site_path="/",
+        products_path=str(products_path),
+        use_search=True,
+    ).model_dump()
+    return main.process_products(config, str(products_path))
@@ -0,0 +1,62 @@
+"""In-memory stand-in for the parts of the Meilisearch client the sync uses."""
+
+import dataclasses
+import types
+
+
+@dataclasses.dataclass
+class Task:
+    uid: int
+    status: str = "succeeded"
+    error: dict | None = None
+
+    @property
+    def task_uid(self) -> int:
+        return self.uid
+
+
+class FakeIndex:
+    """Applies every task as soon as it is enqueued."""
+
+    def __init__(self, documents: list[dict] | None = None):
+        self.documents = {document["id"]: document for document in documents or []}
+        self.tasks: list[Task] = list()
+
+    def _task(self) -> Task:
+        self.tasks.append(Task(len(self.tasks)))
+        return self.tasks[-1]
+
+    def add_documents(self, documents: list[dict], primary_key: str) -> Task:
+        for document in documents:
+            self.documents[document[primary_key]] = document
+        return self._task()
+
+    def delete_documents(self, ids: list[str]) -> Task:
+        for document_id in ids:
+            self.documents.pop(document_id)
+        return self._task()
+
+    def get_documents(self, parameters: dict) -> types.SimpleNamespace:
+        ids = sorted(self.documents)
+        start = parameters["offset"]
+        page = ids[start : start + parameters["limit"]]  # noqa: E203
+        results = [
+            # Only the requested fields a document has, like the server
+            types.SimpleNamespace(
+                **{
+                    field: self.documents[document_id][field]
+                    for field in parameters["fields"]
+                    if field in self.documents[document_id]
+                }
+            )
+            for document_id in page
+        ]
+        return types.SimpleNamespace(results=results, total=len(ids))
+
+
+class FakeClient:
+    def __init__(self, index: FakeIndex):
+        self.index = index
+
+    def wait_for_task(self, uid: int, timeout_in_ms: int) -> Task:
+        return self.index.tasks[uid]
@@ -0,0 +1,56 @@
+import json
+
+import add_to_search
+import pytest
+from fake_meilisearch import FakeClient, FakeIndex
+
+
+@pytest.fixture(autouse=True)
+def small_batches(monkeypatch):
+    # Several batches and pages of documents even for a handful of them
+    monkeypatch.setattr(add_to_search, "BATCH_SIZE", 2)
+
+
+def _export(path, documents: dict[str, dict]) -> list:
+    path.mkdir(exist_ok=True)
+    with open(path / "product.ndjson", "w") as f:
+        for document_id, fields in documents.items():
+            f.write(json.dumps({"id": document_id} | fields) + "\n")
+    return add_to_search._find_documents(path)
+
+
+def _sync(index, files, full=False):
+    return add_to_search.sync(
+        FakeClient(index), index, add_to_search._iter_documents(files), full
+    )
+
+
+def test_sync_sends_only_changes(tmp_path):
+    documents = {f"V-{n}": {"title": f"Control {n}"} for n in range(5)}
+    index = FakeIndex()
+    assert _sync(index, _export(tmp_path, documents)) == (5, 5, 0)
+    assert _sync(index, _export(tmp_path, documents)) == (5, 0, 0)
+
+    documents["V-1"]["title"] = "Changed"
+    del documents["V-2"]
+    documents["V-9"] = {"title": "New"}
+    assert _sync(index, _export(tmp_path, documents)) == (5, 2, 1)
+    assert sorted(index.documents) == sorted(documents)
+    assert index.documents["V-1"]["title"] == "Changed"
+    assert _sync(index, _export(tmp_path, documents)) == (5, 0, 0)
+
+
+def test_sync_resends_documents_without_a_hash(tmp_path):
+    # An index filled before hashes were stored, with a control since removed
+    index = FakeIndex([{"id": "V-1", "title": "One"}, {"id": "V-7", "title": "Old"}])
+    files = _export(tmp_path, {"V-1": {"title": "One"}})
+    assert _sync(index, files) == (1, 1, 1)
+    assert list(index.documents) == ["V-1"]
+    assert _sync(index, files) == (1, 0, 0)
+
+
+def test_full_sync_sends_every_document(tmp_path):
+    files = _export(tmp_path, {f"V-{n}": {"title": "Control"} for n in range(3)})
+    index = FakeIndex()
+    _sync(index, files)
+    assert _sync(index, files, full=True) == (3, 3, 0)
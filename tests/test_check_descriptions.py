@@ -0,0 +1,16 @@
+import pathlib
+
+import check_descriptions
+import pytest
+
+PRODUCTS_PATH = pathlib.Path(__file__).parent.parent / "products"
+STIG_FILES = sorted(PRODUCTS_PATH.glob("*/v*.xml"))
+
+
+@pytest.mark.parametrize(
+    "path", STIG_FILES, ids=lambda path: str(path.relative_to(PRODUCTS_PATH))
+)
+def test_one_pass_parser_matches_elementtree(path):
+    totals = check_descriptions.new_totals()
+    assert check_descriptions.check_file(path, totals) == []
+    assert totals["rules"]
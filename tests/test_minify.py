@@ -0,0 +1,71 @@
+import minify_html
+import pytest
+from jinja2 import Environment, FileSystemLoader
+
+from stigaview_static import html_output, output
+from stigaview_static.utils import get_config, get_git_revision_short_hash
+
+
+@pytest.fixture
+def writer():
+    output.activate(output.DirectoryWriter(0))
+    yield
+    output.active().close()
+    html_output.configure()
+
+
+@pytest.fixture(scope="module")
+def pages(site) -> list[tuple[str, dict]]:
+    products, srgs = site
+    pages = list()
+    for product in products:
+        pages.append(("product.html", {"product": product}))
+        for stig in product.stigs:
+            pages.append(("stig.html", {"product": product, "stig": stig}))
+            # The full view and the first pages, with the pager
+            for context in html_output.onepage_pages(product, stig, 20)[:3]:
+                pages.append(("one_page_stig.html", context))
+            for control in stig.sorted_controls[:5]:
+                pages.append(("control.html", {"control": control}))
+    for srg_id in list(srgs)[:10]:
+        for context in html_output.srg_pages(srg_id, srgs[srg_id], 2)[:3]:
+            pages.append(("srg_detail.html", context))
+    return pages
+
+
+def _original_environment() -> Environment:
+    """The templates as they are on disk, every fragment rendered inline."""
+    env = Environment(loader=FileSystemLoader("templates"))
+    env.filters["severity_to_cat"] = html_output._severity_to_cat
+    env.globals["fragment"] = lambda kind, control: env.get_template(
+        f"fragments/{kind}.html"
+    ).render(control=control)
+    return env
+
+
+def _render(template: str, kwargs: dict, path) -> str:
+    html_output.render_template(template, str(path), **kwargs)
+    output.active().flush()
+    return path.read_text()
+
+
+def test_pages_match_minify_html_of_the_original_templates(pages, writer, tmp_path):
+    original = _original_environment()
+    context = get_config() | {
+        "search_backend": "meilisearch",
+        "git_sha": get_git_revision_short_hash(),
+    }
+    path = tmp_path / "index.html"
+    for template, kwargs in pages:
+        expected = minify_html.minify(
+            original.get_template(template).render(**kwargs | context)
+        )
+        html_output.configure(minify_pages=True)
+        assert _render(template, kwargs, path) == expected, template
+        # Stripping the templates only drops whitespace minify_html would
+        html_output.configure(minify_pages=False)
+        stripped = _render(template, kwargs, path)
+        assert minify_html.minify(stripped) == expected, template
+        assert len(stripped) <= len(
+            original.get_template(template).render(**kwargs | context)
+        )
@@ -1,14 +1,26 @@
 import argparse
+import concurrent.futures
+import gzip
+import hashlib
 import json
 import os
 import pathlib
 import sys
-from typing import Generator, List
+from typing import Generator, Iterable, Iterator, List
 
-import meilisearch
+try:
+    import meilisearch
+except ImportError:
+    meilisearch = None
 
 SEARCH_HOST = os.environ.get("SEARCH_HOST", "https://search.stigaview.com")
 MASTER_KEY = os.environ.get("SEARCH_MASTER_KEY")
+# Each document in the index carries the hash of its content, so a sync only
+# needs the index itself to know what changed since the last one
+HASH_FIELD = "sync_hash"
+BATCH_SIZE = 1000
+WAIT_THREADS = 8
+TASK_TIMEOUT_MS = 10 * 60 * 1000
 
 
 def _get_arg_parser() -> argparse.ArgumentParser:
@@ -17,7 +29,13 @@ def _get_arg_parser() -> argparse.ArgumentParser:
         "--json-output-path",
         required=True,
         type=str,
-        help="Path to output JSON. Normally out/json",
+        help="Path to the search export, normally out/search. "
+        "A directory of per control JSON files such as out/json_controls also works",
+    )
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="Send every document, even those the index already has",
     )
     return parser
 
@@ -27,6 +45,94 @@ def chunk_list(lst: List, chunk_size: int) -> Generator[List, None, None]:
         yield lst[i : i + chunk_size]  # noqa: E203
 
 
+def _find_documents(json_output_path: pathlib.Path) -> list[pathlib.Path]:
+    """NDJSON shards if there are any, otherwise per control JSON files."""
+    shards = sorted(json_output_path.glob("*.ndjson")) + sorted(
+        json_output_path.glob("*.ndjson.gz")
+    )
+    return shards or sorted(json_output_path.glob("*.json"))
+
+
+def _iter_documents(files: list[pathlib.Path]) -> Iterator[tuple[str, bytes]]:
+    for file in files:
+        if file.suffix == ".json":
+            # Controls are written to <primary key>.json, so unchanged
+            # documents never have to be parsed.
+            yield file.stem, file.read_bytes()
+            continue
+        opener = gzip.open if file.suffix == ".gz" else open
+        with opener(file, "rb") as f:
+            for line in f:
+                yield json.loads(line)["id"], line
+
+
+def _index_hashes(index) -> dict[str, str | None]:
+    """Content hash of every document in the index, by document ID."""
+    hashes = dict()
+    offset = 0
+    while True:
+        documents = index.get_documents(
+            {"fields": ["id", HASH_FIELD], "offset": offset, "limit": BATCH_SIZE}
+        )
+        for document in documents.results:
+            # Documents sent before hashes were stored don't have one
+            hashes[document.id] = getattr(document, HASH_FIELD, None)
+        offset += len(documents.results)
+        if not documents.results or offset >= documents.total:
+            return hashes
+
+
+def _wait_for_tasks(client, tasks: list) -> None:
+    def wait(task):
+        return client.wait_for_task(task.task_uid, timeout_in_ms=TASK_TIMEOUT_MS)
+
+    with concurrent.futures.ThreadPoolExecutor(WAIT_THREADS) as executor:
+        for task in executor.map(wait, tasks):
+            if task.status != "succeeded":
+                raise RuntimeError(
+                    f"Search task {task.uid} {task.status}: {task.error}"
+                )
+
+
+def sync(
+    client,
+    index,
+    documents: Iterable[tuple[str, bytes]],
+    full: bool = False,
+) -> tuple[int, int, int]:
+    """
+    Send the documents that were added or changed since the previous sync
+    and delete the ones that are gone.
+
+    What changed is found from the hashes stored in the index, with full
+    every document is sent. Returns the number of documents, and of those
+    sent and deleted.
+    """
+    previous = _index_hashes(index)
+    current = set()
+    tasks = list()
+    batch = list()
+    sent = 0
+    for document_id, content in documents:
+        digest = hashlib.sha256(content).hexdigest()
+        current.add(document_id)
+        if not full and previous.get(document_id) == digest:
+            continue
+        batch.append(json.loads(content) | {HASH_FIELD: digest})
+        if len(batch) == BATCH_SIZE:
+            tasks.append(index.add_documents(batch, primary_key="id"))
+            sent += len(batch)
+            batch = list()
+    if batch:
+        tasks.append(index.add_documents(batch, primary_key="id"))
+        sent += len(batch)
+    removed = [document_id for document_id in previous if document_id not in current]
+    for ids in chunk_list(removed, BATCH_SIZE):
+        tasks.append(index.delete_documents(ids))
+    _wait_for_tasks(client, tasks)
+    return len(current), sent, len(removed)
+
+
 def main():
     if not SEARCH_HOST:
         print("Please set the environment variable SEARCH_HOST", file=sys.stderr)
@@ -35,6 +141,9 @@ def main():
         print("Please set the environment variable SEARCH_MASTER_KEY", file=sys.stderr)
         sys.exit(1)
     args = _get_arg_parser().parse_args()
+    if meilisearch is None:
+        print("Please install the meilisearch package", file=sys.stderr)
+        sys.exit(1)
     json_output_path = pathlib.Path(args.json_output_path)
     if not json_output_path.exists():
         print(
@@ -47,8 +156,8 @@ def main():
             file=sys.stderr,
         )
         sys.exit(1)
-    json_files = list(json_output_path.glob("*.json"))
-    if len(json_files) == 0:
+    files = _find_documents(json_output_path)
+    if not files:
         print(f"No JSON files found in {json_output_path.absolute()}", file=sys.stderr)
         sys.exit(1)
     client = meilisearch.Client(SEARCH_HOST, MASTER_KEY)
@@ -57,12 +166,11 @@ def main():
     if not index:
         print("No index found", file=sys.stderr)
         sys.exit(1)
-    docs = list()
-    for file in json_files:
-        docs.append(json.loads(file.read_text()))
-    tasks = index.add_documents_in_batches(docs, primary_key="id")
-    for task in tasks:
-        client.wait_for_task(task.task_uid)
+    total, sent, deleted = sync(client, index, _iter_documents(files), args.full)
+    print(
+        f"Sent {sent} of {total} documents, deleted {deleted}",
+        file=sys.stderr,
+    )
 
 
 if __name__ == "__main__":
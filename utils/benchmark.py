@@ -0,0 +1,533 @@
+#!/usr/bin/env python3
+import argparse
+import datetime
+import gzip
+import json
+import multiprocessing
+import os
+import pathlib
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from xml.sax.saxutils import escape
+
+import minify_html
+from jinja2 import Environment, FileSystemLoader
+
+from stigaview_static import (
+    cross_reference,
+    html_output,
+    json_output,
+    minify,
+    search_index,
+    utils,
+)
+from stigaview_static.cache import ParseCache
+from stigaview_static.main import (
+    load_config,
+    process_products,
+    process_products_pipelined,
+)
+
+STAGES = ("import", "render", "build", "pipeline", "search", "minify")
+
+# Shape of the real products/ tree, used to size the synthetic corpus
+SYNTHETIC_PRODUCTS = 42
+SYNTHETIC_STIGS_PER_PRODUCT = 6
+SYNTHETIC_CONTROLS_PER_STIG = 245
+SYNTHETIC_SRGS = 830
+
+# Page sizes the paged views are timed with
+ONEPAGE_PAGE_SIZE = 50
+SRG_PAGE_SIZE = 250
+
+WORDS = (
+    "the operating system must configure audit records account session "
+    "cryptographic module verify command finding policy integrity access "
+    "privileged users services network protection remote logon configuration "
+    "file permissions package daemon kernel parameter mount option"
+).split()
+DESCRIPTION_ELEMENTS = (
+    "FalsePositives",
+    "FalseNegatives",
+    "Documentable",
+    "Mitigations",
+    "SeverityOverrideGuidance",
+    "PotentialImpacts",
+    "ThirdPartyTools",
+    "MitigationControl",
+    "Responsibility",
+    "IAControls",
+)
+
+
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Benchmark the import, render, build and search index stages of the site generator"
+    )
+    parser.add_argument(
+        "--config",
+        help="Path to config file, defaults to stigaview.toml",
+        default="stigaview.toml",
+    )
+    parser.add_argument(
+        "--input", help="Input folder, defaults to products", default="products"
+    )
+    parser.add_argument(
+        "--synthetic-scale",
+        help="Benchmark a generated corpus this many times the size of products/ instead",
+        type=float,
+    )
+    parser.add_argument(
+        "--synthetic-dir",
+        help="Keep the generated corpus in this folder instead of a temporary one",
+    )
+    parser.add_argument(
+        "--stages",
+        help=f"Comma separated stages to run, defaults to {','.join(STAGES)}",
+        default=",".join(STAGES),
+    )
+    parser.add_argument(
+        "--limit",
+        help="Pages of each type to time in the render stage, defaults to 500",
+        type=int,
+        default=500,
+    )
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument(
+        "--compare",
+        nargs=2,
+        metavar=("OLD", "NEW"),
+        help="Compare two result files written by --output and exit",
+    )
+    parser.add_argument("--run-stage", choices=STAGES, help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def _words(rng: random.Random, count: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(count))
+
+
+def _paragraphs(rng: random.Random, count: int) -> str:
+    return "\n\n".join(_words(rng, rng.randint(20, 60)) for _ in range(count))
+
+
+def _write_synthetic_stig(path: pathlib.Path, rng: random.Random, prefix: str):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('<?xml version="1.0" encoding="utf-8"?>')
+        f.write(
+            '<Benchmark xmlns="http://checklists.nist.gov/xccdf/1.1" '
+            f'id="{prefix}_STIG" xml:lang="en">'
+        )
+        for i in range(SYNTHETIC_CONTROLS_PER_STIG):
+            srg = rng.randrange(SYNTHETIC_SRGS)
+            discussion = _paragraphs(rng, rng.randint(1, 4))
+            if rng.random() < 0.1:
+                discussion += " Replace <placeholder> with the site value."
+            description = f"<VulnDiscussion>{discussion}</VulnDiscussion>" + "".join(
+                f"<{element}></{element}>" for element in DESCRIPTION_ELEMENTS
+            )
+            ccis = "".join(
+                f'<ident system="http://cyber.mil/cci">CCI-{rng.randrange(4000):06d}</ident>'
+                for _ in range(rng.randint(1, 3))
+            )
+            f.write(
+                f'<Group id="V-{100000 + i}"><title>SRG-OS-{srg:06d}-GPOS-{srg:05d}</title>'
+                f'<Rule id="SV-{100000 + i}r1_rule" severity="{rng.choice(("low", "medium", "high"))}">'
+                f"<version>{prefix}-{i:06d}</version>"
+                f"<title>{escape(_words(rng, rng.randint(8, 25)))}</title>"
+                f"<description>{escape(description)}</description>{ccis}"
+                f"<fixtext>{escape(_paragraphs(rng, rng.randint(1, 3)))}</fixtext>"
+                f"<check><check-content>{escape(_paragraphs(rng, rng.randint(1, 3)))}"
+                "</check-content></check></Rule></Group>"
+            )
+        f.write("</Benchmark>")
+
+
+def generate_corpus(path: pathlib.Path, scale: float, seed: int = 0) -> None:
+    """Write a synthetic XCCDF 1.1 corpus shaped like products/, scale times over."""
+    rng = random.Random(seed)
+    release_date = datetime.date(2020, 1, 1)
+    for p in range(max(1, round(SYNTHETIC_PRODUCTS * scale))):
+        short_name = f"synthetic{p:04d}"
+        product_path = path.joinpath(short_name)
+        product_path.mkdir(parents=True)
+        toml = [f'full_name = "Synthetic Product {p}"', f'short_name = "{short_name}"']
+        toml.append("[stigs]")
+        for release in range(1, SYNTHETIC_STIGS_PER_PRODUCT + 1):
+            release_date += datetime.timedelta(days=1)
+            toml.append(f"[stigs.v1r{release}]")
+            toml.append(f"release_date = {release_date.isoformat()}")
+            _write_synthetic_stig(
+                product_path.joinpath(f"v1r{release}.xml"), rng, f"SYN-{p:04d}"
+            )
+        product_path.joinpath("product.toml").write_text("\n".join(toml) + "\n")
+
+
+def _peak_rss_mb() -> float:
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return max(own, children) / 1024
+
+
+def _load(args: argparse.Namespace, parse_cache: ParseCache | None = None):
+    config = load_config(args.config)
+    config["products_path"] = args.input
+    return process_products(config, args.input, parse_cache)
+
+
+def _stage_import(args: argparse.Namespace) -> dict:
+    start = time.perf_counter()
+    products, _ = _load(args)
+    seconds = time.perf_counter() - start
+    files = sum(len(product.stigs) for product in products)
+    controls = sum(len(stig.controls) for product in products for stig in product.stigs)
+    return {
+        "seconds": seconds,
+        "files": files,
+        "controls": controls,
+        "files_per_second": files / seconds,
+        "controls_per_second": controls / seconds,
+    }
+
+
+def _inline_environment(loader: FileSystemLoader) -> Environment:
+    """Environment without caches that renders every fragment inline."""
+    env = Environment(loader=loader)
+    env.filters["severity_to_cat"] = html_output._severity_to_cat
+    env.globals["fragment"] = lambda kind, control: env.get_template(
+        f"fragments/{kind}.html"
+    ).render(control=control)
+    return env
+
+
+def _uncached_render(template: str, out_path: str, **kwargs):
+    # Reproduce the original behaviour of building a new environment and
+    # rereading the site config for every page.
+    env = _inline_environment(FileSystemLoader("templates"))
+    utils.get_config.cache_clear()
+    context = kwargs | utils.get_config()
+    output = env.get_template(template).render(
+        git_sha=utils.get_git_revision_short_hash(), **context
+    )
+    with open(out_path, "w") as fp:
+        fp.write(minify_html.minify(output))
+
+
+def _percentiles_ms(timings: list[float]) -> dict:
+    if len(timings) > 1:
+        percentiles = statistics.quantiles(timings, n=100, method="inclusive")
+    else:
+        percentiles = timings * 99
+    return {
+        "p50_ms": percentiles[49] * 1000,
+        "p90_ms": percentiles[89] * 1000,
+        "p99_ms": percentiles[98] * 1000,
+        "max_ms": max(timings) * 1000,
+    }
+
+
+def _latencies(render, pages: list[tuple[str, dict]], out_dir: str) -> dict:
+    timings = list()
+    for i, (template, context) in enumerate(pages):
+        start = time.perf_counter()
+        render(template, os.path.join(out_dir, f"{i}.html"), **context)
+        timings.append(time.perf_counter() - start)
+    return {
+        "pages": len(timings),
+        "pages_per_second": len(timings) / sum(timings),
+        **_percentiles_ms(timings),
+    }
+
+
+def _first_page(contexts: list[dict]) -> dict:
+    """Page 1 of a paged view, or the full view if it fits on one page."""
+    return contexts[1] if len(contexts) > 1 else contexts[0]
+
+
+def _sample_pages(
+    args: argparse.Namespace, products: list, srgs: dict
+) -> dict[str, list[tuple[str, dict]]]:
+    rng = random.Random(0)
+    stigs = [stig for product in products for stig in product.stigs]
+    controls = [control for stig in stigs for control in stig.controls]
+
+    def sample(items: list) -> list:
+        return rng.sample(items, min(args.limit, len(items)))
+
+    pages = {
+        "control": [
+            ("control.html", {"control": control}) for control in sample(controls)
+        ],
+        "stig": [
+            ("stig.html", {"product": stig.product, "stig": stig})
+            for stig in sample(stigs)
+        ],
+    }
+    # Page 1 of the paged views is what a reader of them waits for, next to
+    # the full views with every control
+    onepage_stigs = sample(stigs)
+    pages["onepage"] = [
+        (
+            "one_page_stig.html",
+            _first_page(
+                html_output.onepage_pages(stig.product, stig, ONEPAGE_PAGE_SIZE)
+            ),
+        )
+        for stig in onepage_stigs
+    ]
+    pages["onepage_unpaged"] = [
+        ("one_page_stig.html", html_output.onepage_pages(stig.product, stig)[0])
+        for stig in onepage_stigs
+    ]
+    srg_ids = sample(list(srgs))
+    pages["srg_detail"] = [
+        (
+            "srg_detail.html",
+            _first_page(html_output.srg_pages(srg_id, srgs[srg_id], SRG_PAGE_SIZE)),
+        )
+        for srg_id in srg_ids
+    ]
+    pages["srg_detail_unpaged"] = [
+        ("srg_detail.html", html_output.srg_pages(srg_id, srgs[srg_id])[0])
+        for srg_id in srg_ids
+    ]
+    pages["product"] = [
+        ("product.html", {"product": product}) for product in sample(products)
+    ]
+    return pages
+
+
+def _stage_render(args: argparse.Namespace) -> dict:
+    with tempfile.TemporaryDirectory() as cache_dir:
+        products, srgs = _load(args, ParseCache(cache_dir, 2**40))
+    page_types = _sample_pages(args, products, srgs)
+    results = dict()
+    with tempfile.TemporaryDirectory() as out_dir:
+        for page_type, pages in page_types.items():
+            results[page_type] = _latencies(html_output.render_template, pages, out_dir)
+        # The per-page environment rendering used before the cached one
+        results["control_uncached"] = _latencies(
+            _uncached_render, page_types["control"][:100], out_dir
+        )
+    return results
+
+
+def _stage_build(args: argparse.Namespace) -> dict:
+    with tempfile.TemporaryDirectory() as cache_dir:
+        products, srgs = _load(args, ParseCache(cache_dir, 2**40))
+    with tempfile.TemporaryDirectory() as out_dir:
+        start = time.perf_counter()
+        references = cross_reference.build(products)
+        html_output.render_stig_index(products, out_dir)
+        html_output.render_srg_index(srgs, out_dir)
+        html_output.render_cci_index(references, out_dir)
+        html_output.write_index(products, out_dir)
+        html_output.write_products(products, srgs, out_dir, references=references)
+        json_output.write_product_stig_map(products, out_dir)
+        seconds = time.perf_counter() - start
+        files = sum(len(filenames) for _, _, filenames in os.walk(out_dir))
+    return {"seconds": seconds, "files": files, "files_per_second": files / seconds}
+
+
+def _stage_pipeline(args: argparse.Namespace) -> dict:
+    """Like the build stage with --pipeline, timed from parsing as it overlaps rendering."""
+    config = load_config(args.config)
+    config["products_path"] = args.input
+    with (
+        tempfile.TemporaryDirectory() as cache_dir,
+        tempfile.TemporaryDirectory() as out_dir,
+    ):
+        start = time.perf_counter()
+        products, srgs, references = process_products_pipelined(
+            config,
+            args.input,
+            out_dir,
+            html_output.DEFAULT_LATEST_STRATEGY,
+            ParseCache(cache_dir, 2**40),
+        )
+        html_output.render_stig_index(products, out_dir)
+        html_output.render_srg_index(srgs, out_dir)
+        html_output.render_cci_index(references, out_dir)
+        html_output.write_index(products, out_dir)
+        html_output.write_products(
+            products, srgs, out_dir, references=references, product_pages=False
+        )
+        json_output.write_product_stig_map(products, out_dir)
+        seconds = time.perf_counter() - start
+        files = sum(len(filenames) for _, _, filenames in os.walk(out_dir))
+    return {"seconds": seconds, "files": files, "files_per_second": files / seconds}
+
+
+def _stage_search(args: argparse.Namespace) -> dict:
+    with tempfile.TemporaryDirectory() as cache_dir:
+        products, _ = _load(args, ParseCache(cache_dir, 2**40))
+    build_seconds = 0.0
+    raw_sizes = list()
+    gzip_sizes = list()
+    load_timings = list()
+    for product in products:
+        start = time.perf_counter()
+        content = json.dumps(
+            search_index.build_index(product), separators=(",", ":")
+        ).encode()
+        build_seconds += time.perf_counter() - start
+        raw_sizes.append(len(content))
+        gzip_sizes.append(len(gzip.compress(content)))
+        # Parsing stands in for what the browser does once a shard arrives
+        start = time.perf_counter()
+        json.loads(content)
+        load_timings.append(time.perf_counter() - start)
+    return {
+        "build_seconds": build_seconds,
+        "shards": len(products),
+        "total_kb": sum(raw_sizes) / 1024,
+        "total_gzip_kb": sum(gzip_sizes) / 1024,
+        "max_shard_kb": max(raw_sizes) / 1024,
+        "max_shard_gzip_kb": max(gzip_sizes) / 1024,
+        "load": _percentiles_ms(load_timings),
+    }
+
+
+def _stage_minify(args: argparse.Namespace) -> dict:
+    """
+    Compare minify_html on every page with only stripping the templates.
+
+    Fails if minify_html gives a different page for the stripped output, as
+    that means the stripping changed more than whitespace it would remove.
+    """
+    with tempfile.TemporaryDirectory() as cache_dir:
+        products, srgs = _load(args, ParseCache(cache_dir, 2**40))
+    original = _inline_environment(FileSystemLoader("templates"))
+    stripped = _inline_environment(minify.MinifyingLoader("templates"))
+    context = {"git_sha": "0"} | utils.get_config()
+    results = dict()
+    for page_type, pages in _sample_pages(args, products, srgs).items():
+        page_timings = list()
+        stripped_timings = list()
+        sizes = {"original": 0, "stripped": 0, "minified": 0}
+        for template, kwargs in pages:
+            start = time.perf_counter()
+            page = original.get_template(template).render(**kwargs, **context)
+            minified = minify_html.minify(page)
+            page_timings.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            stripped_page = stripped.get_template(template).render(**kwargs, **context)
+            stripped_timings.append(time.perf_counter() - start)
+            if minify_html.minify(stripped_page) != minified:
+                raise RuntimeError(
+                    f"{template} for {kwargs} minifies differently from stripped templates"
+                )
+            sizes["original"] += len(page)
+            sizes["stripped"] += len(stripped_page)
+            sizes["minified"] += len(minified)
+        results[page_type] = {
+            "pages": len(pages),
+            **{f"{name}_kb": size / 1024 for name, size in sizes.items()},
+            "minify_pages": _percentiles_ms(page_timings),
+            "strip_templates": _percentiles_ms(stripped_timings),
+        }
+    return results
+
+
+def _run_stage(args: argparse.Namespace) -> dict:
+    stage = {
+        "import": _stage_import,
+        "render": _stage_render,
+        "build": _stage_build,
+        "pipeline": _stage_pipeline,
+        "search": _stage_search,
+        "minify": _stage_minify,
+    }
+    result = stage[args.run_stage](args)
+    result["peak_rss_mb"] = _peak_rss_mb()
+    return result
+
+
+def _run_stages(args: argparse.Namespace, input_path: str) -> dict:
+    # Each stage runs in its own interpreter so peak memory is per stage
+    results = dict()
+    for stage in args.stages.split(","):
+        command = [
+            sys.executable,
+            __file__,
+            "--run-stage",
+            stage,
+            "--config",
+            args.config,
+            "--input",
+            input_path,
+            "--limit",
+            str(args.limit),
+        ]
+        print(f"Running {stage} stage", file=sys.stderr)
+        output = subprocess.run(command, check=True, stdout=subprocess.PIPE).stdout
+        results[stage] = json.loads(output)
+    return results
+
+
+def _flatten(results: dict, prefix: str = "") -> dict[str, float]:
+    flat = dict()
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(_flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)):
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+
+def _compare(old_path: str, new_path: str) -> None:
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    print(f"{'metric':<45} {old['commit']:>12} {new['commit']:>12} {'change':>8}")
+    old_stages = _flatten(old["stages"])
+    new_stages = _flatten(new["stages"])
+    for metric, old_value in old_stages.items():
+        if metric not in new_stages:
+            continue
+        new_value = new_stages[metric]
+        change = f"{new_value / old_value:.2f}x" if old_value else "-"
+        print(f"{metric:<45} {old_value:>12.2f} {new_value:>12.2f} {change:>8}")
+
+
+def main() -> int:
+    args = _parse_args()
+    if args.compare:
+        _compare(*args.compare)
+        return 0
+    if args.run_stage:
+        json.dump(_run_stage(args), sys.stdout)
+        return 0
+    with tempfile.TemporaryDirectory() as tmp:
+        corpus = {"name": "products", "path": args.input}
+        if args.synthetic_scale:
+            corpus_path = pathlib.Path(args.synthetic_dir or tmp)
+            if not corpus_path.joinpath("synthetic0000").exists():
+                print("Generating synthetic corpus", file=sys.stderr)
+                generate_corpus(corpus_path, args.synthetic_scale)
+            corpus = {
+                "name": f"synthetic-x{args.synthetic_scale:g}",
+                "path": str(corpus_path),
+            }
+        results = {
+            "commit": utils.get_git_revision_short_hash(),
+            "cpus": multiprocessing.cpu_count(),
+            "corpus": corpus["name"],
+            "stages": _run_stages(args, corpus["path"]),
+        }
+    for metric, value in _flatten(results["stages"]).items():
+        print(f"{metric:<45} {value:>12.2f}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
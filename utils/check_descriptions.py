@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+import argparse
+import pathlib
+import sys
+import time
+
+from stigaview_static import import_stig
+
+NS = import_stig.NS
+
+
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Check the one pass description parser against ElementTree"
+    )
+    parser.add_argument(
+        "--input", help="Input folder, defaults to products", default="products"
+    )
+    return parser.parse_args()
+
+
+def _legacy(raw_description: str) -> str:
+    root = import_stig._get_description_root(raw_description)
+    return import_stig._disa_text_to_html(root.find("VulnDiscussion").text)
+
+
+def check_file(path: pathlib.Path, totals: dict) -> list[str]:
+    """STIG IDs of the rules whose discussion the two parsers disagree on."""
+    differences = list()
+    for group in import_stig._iter_groups(path):
+        for rule in group.findall("xccdf-1.1:Rule", NS):
+            raw = rule.find("xccdf-1.1:description", NS).text
+            start = time.perf_counter()
+            try:
+                expected = _legacy(raw)
+            except Exception as e:
+                expected = repr(e)
+            totals["legacy_seconds"] += time.perf_counter() - start
+            start = time.perf_counter()
+            discussion = import_stig._parse_vuln_discussion(raw)
+            if discussion is not None:
+                discussion = import_stig._disa_text_to_html(discussion)
+            totals["seconds"] += time.perf_counter() - start
+            totals["rules"] += 1
+            if discussion is None:
+                totals["fallback"] += 1
+                continue
+            if discussion != expected:
+                differences.append(rule.find("xccdf-1.1:version", NS).text)
+    return differences
+
+
+def new_totals() -> dict:
+    return {"rules": 0, "fallback": 0, "seconds": 0.0, "legacy_seconds": 0.0}
+
+
+def main() -> int:
+    args = _parse_args()
+    totals = new_totals()
+    ok = True
+    for path in sorted(pathlib.Path(args.input).glob("*/v*.xml")):
+        for rule_id in check_file(path, totals):
+            print(f"{path}: {rule_id} differs", file=sys.stderr)
+            ok = False
+    print(
+        f"{totals['rules']} rules, {totals['fallback']} through ElementTree, "
+        f"{totals['seconds']:.2f}s one pass vs {totals['legacy_seconds']:.2f}s ElementTree"
+    )
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
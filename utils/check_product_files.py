@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+import argparse
+import multiprocessing
+import os
+import pathlib
+import re
+import sys
+import tomllib
+from xml.etree import ElementTree
+
+import pydantic
+
+from stigaview_static import import_stig, models
+from stigaview_static.cache import DEFAULT_CACHE_DIR, DEFAULT_MAX_SIZE_MB, ParseCache
+
+NS = import_stig.NS
+XCCDF = NS["xccdf-1.1"]
+BENCHMARK_TAG = f"{{{XCCDF}}}Benchmark"
+VERSION_TAG = f"{{{XCCDF}}}version"
+PLAIN_TEXT_TAG = f"{{{XCCDF}}}plain-text"
+HEADER_CHUNK_SIZE = 64 * 1024
+# Elements every Rule needs for the build, relative to the Rule
+RULE_ELEMENTS = {
+    "title": "xccdf-1.1:title",
+    "version": "xccdf-1.1:version",
+    "description": "xccdf-1.1:description",
+    "fixtext": "xccdf-1.1:fixtext",
+    "check-content": "xccdf-1.1:check/xccdf-1.1:check-content",
+}
+_FILE_NAME = re.compile(r"v(?P<version>\d+)r(?P<release>\d+)\.xml")
+_RELEASE_INFO = re.compile(r"Release: (?P<release>\d+)")
+
+
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Check that every STIG in the products folder is XCCDF the build can read"
+    )
+    parser.add_argument(
+        "--input", help="Input folder, defaults to products", default="products"
+    )
+    parser.add_argument(
+        "--cache-dir",
+        help=f"Directory for cached STIG parses shared with the build, defaults to {DEFAULT_CACHE_DIR}/",
+        default=DEFAULT_CACHE_DIR,
+    )
+    parser.add_argument(
+        "--no-cache",
+        help="Parse every STIG from XML without reading or writing the parse cache",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--jobs",
+        help="Processes to check with, defaults to the number of CPUs",
+        default=multiprocessing.cpu_count(),
+        type=int,
+    )
+    return parser.parse_args()
+
+
+def _read_header(path: pathlib.Path) -> tuple[str | None, str | None, str | None]:
+    """Root tag, version and release of a benchmark, read up to its first Group."""
+    parser = ElementTree.XMLPullParser(events=("start", "end"))
+    root_tag = version = release = None
+    depth = 0
+    with open(path, "rb") as f:
+        while chunk := f.read(HEADER_CHUNK_SIZE):
+            parser.feed(chunk)
+            for event, element in parser.read_events():
+                if event == "start":
+                    depth += 1
+                    if root_tag is None:
+                        root_tag = element.tag
+                    elif depth == 2 and element.tag == import_stig.GROUP_TAG:
+                        return root_tag, version, release
+                    continue
+                depth -= 1
+                if depth != 1:
+                    continue
+                if element.tag == VERSION_TAG:
+                    version = element.text
+                elif (
+                    element.tag == PLAIN_TEXT_TAG
+                    and element.get("id") == "release-info"
+                ):
+                    matches = _RELEASE_INFO.match(element.text or "")
+                    release = matches["release"] if matches else None
+    return root_tag, version, release
+
+
+def _diagnose(path: pathlib.Path) -> list[str]:
+    """Find what is missing from a STIG the build failed to parse."""
+    problems = list()
+    try:
+        for group in import_stig._iter_groups(path):
+            group_id = group.get("id", "Group")
+            if group.find("xccdf-1.1:title", NS) is None:
+                problems.append(f"{group_id} has no title")
+            rules = group.findall("xccdf-1.1:Rule", NS)
+            if not rules:
+                problems.append(f"{group_id} has no Rule")
+            for rule in rules:
+                rule_id = f"{group_id} {rule.get('id', 'Rule')}"
+                if "severity" not in rule.attrib:
+                    problems.append(f"{rule_id} has no severity")
+                for name, path_in_rule in RULE_ELEMENTS.items():
+                    element = rule.find(path_in_rule, NS)
+                    if element is None or element.text is None:
+                        problems.append(f"{rule_id} has no {name}")
+                description = rule.find(RULE_ELEMENTS["description"], NS)
+                if description is None or description.text is None:
+                    continue
+                try:
+                    import_stig._get_vuln_discussion(description.text)
+                except (ElementTree.ParseError, AttributeError):
+                    problems.append(f"{rule_id} has no readable VulnDiscussion")
+    except ElementTree.ParseError as e:
+        problems.append(f"not well-formed XML: {e}")
+    return problems
+
+
+def _check_file(
+    job: tuple[pathlib.Path, dict | None, ParseCache | None],
+) -> tuple[pathlib.Path, list[str], bool]:
+    """
+    Check one STIG, parsing it exactly like the build does.
+
+    Rows parsed here go into the shared parse cache, so a build straight
+    after the check doesn't parse the file again.
+    """
+    path, config_entry, parse_cache = job
+    problems = list()
+    try:
+        root_tag, version, release = _read_header(path)
+    except ElementTree.ParseError as e:
+        return path, [f"not well-formed XML: {e}"], False
+    if root_tag != BENCHMARK_TAG:
+        return path, [f"root element is {root_tag}, not an XCCDF 1.1 Benchmark"], False
+    matches = _FILE_NAME.fullmatch(path.name)
+    if matches is None:
+        problems.append("file name doesn't match v<version>r<release>.xml")
+    elif (matches["version"], matches["release"]) != (version, release):
+        problems.append(
+            f"file name is for V{matches['version']}R{matches['release']} "
+            f"but the benchmark is V{version}R{release}"
+        )
+    if config_entry is None:
+        # Not in product.toml, so the build never reads it with this key
+        parse_cache = None
+    try:
+        rows, hit = import_stig.parse_stig_file(path, config_entry or {}, parse_cache)
+    except (ElementTree.ParseError, AttributeError, KeyError, TypeError):
+        return path, problems + (_diagnose(path) or ["can't be parsed"]), False
+    if not rows:
+        problems.append("has no Group with a Rule")
+    return path, problems, hit
+
+
+def _check_product(product_path: pathlib.Path) -> tuple[dict | None, list[str]]:
+    """Load and check product.toml against the STIGs next to it."""
+    config_path = product_path.joinpath("product.toml")
+    if not config_path.exists():
+        return None, [f"{config_path}: missing"]
+    try:
+        config = models.ProductConfig(
+            **tomllib.loads(config_path.read_text())
+        ).model_dump()
+    except (tomllib.TOMLDecodeError, pydantic.ValidationError) as e:
+        return None, [f"{config_path}: {e}"]
+    problems = list()
+    if config["short_name"] != product_path.name:
+        problems.append(
+            f"{config_path}: short_name {config['short_name']} doesn't match "
+            f"the folder name {product_path.name}"
+        )
+    files = {path.stem for path in product_path.glob("v*.xml")}
+    for short_version in sorted(files - config["stigs"].keys()):
+        problems.append(f"{config_path}: no entry for {short_version}")
+    for short_version in sorted(config["stigs"].keys() - files):
+        problems.append(f"{config_path}: {short_version}.xml doesn't exist")
+    return config, problems
+
+
+def main() -> int:
+    args = _parse_args()
+    parse_cache = None
+    if not args.no_cache:
+        parse_cache = ParseCache(
+            os.path.join(args.cache_dir, "stigs"), DEFAULT_MAX_SIZE_MB * 1024 * 1024
+        )
+    problems = list()
+    jobs = list()
+    for product_path in sorted(pathlib.Path(args.input).iterdir()):
+        if not product_path.is_dir():
+            continue
+        config, product_problems = _check_product(product_path)
+        problems.extend(product_problems)
+        stigs = config["stigs"] if config is not None else dict()
+        for path in sorted(product_path.glob("v*.xml")):
+            jobs.append((path, stigs.get(path.stem), parse_cache))
+    # Biggest files first so one large STIG isn't checked on its own at the end
+    jobs.sort(key=lambda job: job[0].stat().st_size, reverse=True)
+    hits = 0
+    with multiprocessing.Pool(args.jobs) as pool:
+        for path, file_problems, hit in pool.imap_unordered(_check_file, jobs):
+            problems.extend(f"{path}: {problem}" for problem in file_problems)
+            hits += hit
+    if parse_cache is not None:
+        parse_cache.evict()
+    for problem in sorted(problems):
+        print(problem, file=sys.stderr)
+    print(
+        f"Checked {len(jobs)} files ({hits} from the parse cache), "
+        f"{len(problems)} problems"
+    )
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
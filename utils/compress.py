@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+import argparse
+import gzip
+import hashlib
+import json
+import multiprocessing
+import os
+import sys
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+MANIFEST_NAME = ".compress-manifest.json"
+EXTENSIONS = (".html", ".json", ".css", ".js")
+FORMATS = ("gz", "br", "zst")
+DEFAULT_LEVELS = {"gz": 9, "br": 11, "zst": 19}
+
+
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Write precompressed siblings of the HTML, JSON, CSS and JS files"
+    )
+    parser.add_argument(
+        "--output_path",
+        help="Root of the output path",
+        default="out",
+    )
+    parser.add_argument(
+        "--formats",
+        help=f"Comma separated formats out of {','.join(FORMATS)}, defaults to gz",
+        default="gz",
+    )
+    for name, level in DEFAULT_LEVELS.items():
+        parser.add_argument(
+            f"--{name}-level",
+            help=f"Compression level for .{name}, defaults to {level}",
+            default=level,
+            type=int,
+        )
+    parser.add_argument(
+        "--jobs",
+        help="Processes to compress with, defaults to the number of CPUs",
+        default=multiprocessing.cpu_count(),
+        type=int,
+    )
+    args = parser.parse_args()
+    args.formats = args.formats.split(",")
+    for name in args.formats:
+        if name not in FORMATS:
+            parser.error(f"Unknown format {name}")
+    if "br" in args.formats and brotli is None:
+        parser.error("br needs the brotli package")
+    if "zst" in args.formats and zstandard is None:
+        parser.error("zst needs the zstandard package")
+    return args
+
+
+def _compress(name: str, data: bytes, level: int) -> bytes:
+    if name == "gz":
+        # A fixed mtime keeps the output the same for the same content
+        return gzip.compress(data, compresslevel=level, mtime=0)
+    if name == "br":
+        return brotli.compress(data, quality=level)
+    return zstandard.ZstdCompressor(level=level).compress(data)
+
+
+def _compress_file(job: tuple[str, dict[str, int], str | None]) -> tuple:
+    """Write the siblings of one file unless its content is unchanged."""
+    path, levels, previous = job
+    with open(path, "rb") as f:
+        data = f.read()
+    digest = hashlib.sha256(data).hexdigest()
+    sizes = dict()
+    up_to_date = previous == digest and all(
+        os.path.exists(f"{path}.{name}") for name in levels
+    )
+    for name, level in levels.items():
+        sibling = f"{path}.{name}"
+        if up_to_date:
+            sizes[name] = os.path.getsize(sibling)
+            continue
+        compressed = _compress(name, data, level)
+        with open(sibling, "wb") as f:
+            f.write(compressed)
+        sizes[name] = len(compressed)
+    return path, digest, len(data), sizes, not up_to_date
+
+
+def _find_files(output_path: str) -> tuple[list[str], list[str]]:
+    """Files to compress, and siblings left behind by files since removed."""
+    files = list()
+    orphans = list()
+    for root, _, filenames in os.walk(output_path):
+        names = set(filenames)
+        for filename in filenames:
+            if filename.startswith("."):
+                # Build bookkeeping such as the manifests, not part of the site
+                continue
+            if filename.endswith(EXTENSIONS):
+                files.append(os.path.join(root, filename))
+                continue
+            base, extension = os.path.splitext(filename)
+            if extension[1:] in FORMATS and base.endswith(EXTENSIONS):
+                if base not in names:
+                    orphans.append(os.path.join(root, filename))
+    return files, orphans
+
+
+def _load_manifest(
+    path: str, levels: dict[str, int]
+) -> tuple[dict[str, str], dict[str, str]]:
+    """
+    Digests of the files compressed by the last run, and the format of each
+    sibling it wrote.
+    """
+    if not os.path.exists(path):
+        return dict(), dict()
+    with open(path) as f:
+        manifest = json.load(f)
+    siblings = manifest.get("siblings", dict())
+    # Changing the formats or levels means every file has to be redone
+    if manifest.get("levels") != levels:
+        return dict(), siblings
+    return manifest["files"], siblings
+
+
+def main() -> int:
+    args = _parse_args()
+    levels = {name: getattr(args, f"{name}_level") for name in args.formats}
+    manifest_path = os.path.join(args.output_path, MANIFEST_NAME)
+    previous, previous_siblings = _load_manifest(manifest_path, levels)
+    files, orphans = _find_files(args.output_path)
+    # Siblings in a format that is no longer requested are stale as well
+    stale = set(orphans)
+    for key, name in previous_siblings.items():
+        sibling = os.path.join(args.output_path, key)
+        if name not in levels and os.path.lexists(sibling):
+            stale.add(sibling)
+    for path in stale:
+        os.remove(path)
+    jobs = list()
+    for path in files:
+        key = os.path.relpath(path, args.output_path)
+        jobs.append((path, levels, previous.get(key)))
+    digests = dict()
+    original = 0
+    compressed = dict.fromkeys(levels, 0)
+    written = 0
+    with multiprocessing.Pool(args.jobs) as pool:
+        for path, digest, size, sizes, changed in pool.imap_unordered(
+            _compress_file, jobs, chunksize=64
+        ):
+            digests[os.path.relpath(path, args.output_path)] = digest
+            original += size
+            for name, compressed_size in sizes.items():
+                compressed[name] += compressed_size
+            written += changed
+    with open(manifest_path, "w") as f:
+        siblings = {f"{key}.{name}": name for key in digests for name in levels}
+        json.dump({"levels": levels, "files": digests, "siblings": siblings}, f)
+    print(
+        f"Compressed {written} of {len(files)} files, "
+        f"removed {len(stale)} stale compressed files",
+        file=sys.stderr,
+    )
+    for name, total in compressed.items():
+        saved = original - total
+        print(
+            f".{name}: {original} bytes to {total} bytes, "
+            f"{saved} bytes ({saved / max(original, 1):.1%}) saved",
+            file=sys.stderr,
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,18 +1,45 @@
 #!/usr/bin/env python3
 
 import argparse
+import datetime
 import glob
+import hashlib
+import json
+import multiprocessing
+import os
 import pathlib
 import re
 import sys
+import tomllib
 import zipfile
+from xml.etree import ElementTree
+
+DEFAULT_MANIFEST = os.path.join(".cache", "import-manifest.json")
+CHUNK_SIZE = 1024 * 1024
+XCCDF_BENCHMARK = "{http://checklists.nist.gov/xccdf/1.1}Benchmark"
+PRODUCT_REGEX = re.compile(
+    r"U_(?P<product>.+)_V(?P<version>\d+)R(?P<release>\d+)_(?P<type>STIG|SRG)\.zip"
+)
 
 
 def _parse_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser()
     parser.add_argument("--download-root", required=True)
     parser.add_argument("--root", required=True)
-    parser.add_argument("--release-date", required=True)
+    parser.add_argument(
+        "--release-date", required=True, type=datetime.date.fromisoformat
+    )
+    parser.add_argument(
+        "--manifest",
+        default=DEFAULT_MANIFEST,
+        help=f"Hashes of the zips already imported, defaults to {DEFAULT_MANIFEST}",
+    )
+    parser.add_argument(
+        "--jobs",
+        help="Processes to import with, defaults to the number of CPUs",
+        default=multiprocessing.cpu_count(),
+        type=int,
+    )
     return parser.parse_args()
 
 
@@ -56,53 +83,237 @@ disa_to_shortname = {
 }
 
 
+def _file_digest(path: pathlib.Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _partial_path(path: pathlib.Path) -> pathlib.Path:
+    """
+    Where to write path before moving it into place, named after this
+    process so no other import process writes to it.
+    """
+    return path.with_name(f".{path.name}.{os.getpid()}.partial")
+
+
+def _extract_xccdf(
+    z: zipfile.ZipFile, member: zipfile.ZipInfo, output_path: pathlib.Path
+) -> bool:
+    """
+    Stream member to output_path in chunks, keeping it only if it is XCCDF.
+
+    The root element is checked from the first chunks as they are copied,
+    and the file only appears at output_path once it is complete.
+    """
+    parser = ElementTree.XMLPullParser(events=("start",))
+    root_tag = None
+    partial_path = _partial_path(output_path)
+    try:
+        with z.open(member) as source, open(partial_path, "wb") as target:
+            while chunk := source.read(CHUNK_SIZE):
+                if root_tag is None:
+                    parser.feed(chunk)
+                    for _, element in parser.read_events():
+                        root_tag = element.tag
+                        break
+                target.write(chunk)
+    except ElementTree.ParseError:
+        root_tag = None
+    if root_tag != XCCDF_BENCHMARK:
+        partial_path.unlink()
+        return False
+    os.replace(partial_path, output_path)
+    return True
+
+
+def _resolve(zip_name: str) -> tuple[str, str] | None:
+    """The product short name and STIG short version a zip holds, if known."""
+    matches = PRODUCT_REGEX.match(zip_name)
+    if not matches or matches["product"] not in disa_to_shortname:
+        return None
+    return (
+        disa_to_shortname[matches["product"]],
+        f"v{matches['version']}r{matches['release']}",
+    )
+
+
+def _drop_duplicates(zip_paths: list[pathlib.Path]) -> list[pathlib.Path]:
+    """
+    Keep only the newest of the zips holding the same STIG, such as the two
+    OpenShift names, as they would be extracted to the same file.
+    """
+    newest: dict[tuple[str, str], pathlib.Path] = dict()
+    for zip_path in zip_paths:
+        target = _resolve(zip_path.name)
+        if target is None:
+            continue
+        kept = newest.get(target)
+        if kept is None or zip_path.stat().st_mtime > kept.stat().st_mtime:
+            newest[target] = zip_path
+    kept_paths = list()
+    for zip_path in zip_paths:
+        target = _resolve(zip_path.name)
+        if target is not None and newest[target] != zip_path:
+            print(
+                f"skipping {zip_path} since {newest[target].name} is newer "
+                f"for {target[0]} {target[1]}",
+                file=sys.stderr,
+            )
+            continue
+        kept_paths.append(zip_path)
+    return kept_paths
+
+
+def _import_zip(job: tuple[pathlib.Path, pathlib.Path, str | None]) -> tuple:
+    """
+    Import the STIG in one zip unless the same zip was imported before.
+
+    Returns the zip path, its digest, the product short name and STIG short
+    version it holds, whether its XML was written, and a message for
+    anything that was skipped.
+    """
+    full_zip_path, root, previous = job
+    matches = PRODUCT_REGEX.match(full_zip_path.name)
+    if not matches:
+        message = f"skipping {full_zip_path} since the file name doesn't match the normal pattern"
+        return full_zip_path, None, None, None, False, message
+    product = matches["product"]
+    if product not in disa_to_shortname:
+        return (
+            full_zip_path,
+            None,
+            None,
+            None,
+            False,
+            f"skipping {product} as it is not in known products",
+        )
+    short_name = disa_to_shortname[product]
+    short_version = f"v{matches['version']}r{matches['release']}"
+    digest = _file_digest(full_zip_path)
+    if digest == previous:
+        return full_zip_path, digest, short_name, short_version, False, None
+    output_path = root / "products" / short_name / f"{short_version}.xml"
+    if not output_path.parent.is_dir():
+        message = f"skipping {full_zip_path} since {output_path.parent} doesn't exist"
+        return full_zip_path, None, None, None, False, message
+    if output_path.exists():
+        message = f"File {str(output_path)} already exists for {short_name}."
+        return full_zip_path, digest, short_name, short_version, False, message
+    with zipfile.ZipFile(full_zip_path, "r") as z:
+        for member in z.infolist():
+            if member.filename.endswith(".xml") and _extract_xccdf(
+                z, member, output_path
+            ):
+                return full_zip_path, digest, short_name, short_version, True, None
+    message = f"skipping {full_zip_path} since it has no XCCDF benchmark"
+    return full_zip_path, None, None, None, False, message
+
+
+def _toml_value(value: object) -> str:
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (datetime.date, int)):
+        return str(value)
+    # JSON strings are valid TOML basic strings
+    return json.dumps(value)
+
+
+def dump_product_toml(config: dict) -> str:
+    """Serialize a product.toml in the layout of the ones in products/."""
+    lines = [
+        f"{key} = {_toml_value(value)}"
+        for key, value in config.items()
+        if key != "stigs"
+    ]
+    lines.extend(["", "[stigs]"])
+    for short_version, entry in config["stigs"].items():
+        lines.append(f"[stigs.{short_version}]")
+        for key, value in entry.items():
+            lines.append(f"{key} = {_toml_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+def _add_stigs(
+    product_toml_path: pathlib.Path,
+    short_versions: list[str],
+    release_date: datetime.date,
+) -> None:
+    config = tomllib.loads(product_toml_path.read_text())
+    stigs = config.setdefault("stigs", dict())
+    missing = [version for version in short_versions if version not in stigs]
+    if not missing:
+        return
+    for short_version in sorted(missing):
+        stigs[short_version] = {"release_date": release_date}
+    partial_path = _partial_path(product_toml_path)
+    partial_path.write_text(dump_product_toml(config))
+    os.replace(partial_path, product_toml_path)
+
+
+def _load_manifest(path: str) -> dict[str, str]:
+    if not os.path.exists(path):
+        return dict()
+    with open(path) as f:
+        return json.load(f)
+
+
+def _save_manifest(path: str, manifest: dict[str, str]) -> None:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+
 def main() -> int:
     print("starting")
     args = _parse_args()
     download_root = pathlib.Path(args.download_root)
     root = pathlib.Path(args.root)
-    zip_files = glob.glob("*.zip", root_dir=download_root)
-    for current_zip in zip_files:
-        full_zip_path = download_root / current_zip
-        with zipfile.ZipFile(full_zip_path, "r") as z:
-            product_regex = r"U_(?P<product>.+)_V(?P<version>\d+)R(?P<release>\d+)_(?P<type>STIG|SRG)\.zip"
-            product_regex_matches = re.match(product_regex, current_zip)
-            if not product_regex_matches:
-                print(
-                    f"skipping {full_zip_path} since the file name doesn't match the normal pattern"
-                )
-                continue
-            matches_dict = product_regex_matches.groupdict()
-            version = matches_dict["version"]
-            release = matches_dict["release"]
-            product = matches_dict["product"]
-            short_version = f"v{version}r{release}"
-            if product not in disa_to_shortname:
-                print(f"skipping {product} as it is not in known products")
+    manifest = _load_manifest(args.manifest)
+    zip_paths = [
+        download_root / current_zip
+        for current_zip in sorted(glob.glob("*.zip", root_dir=download_root))
+    ]
+    jobs = [
+        (zip_path, root, manifest.get(zip_path.name))
+        for zip_path in _drop_duplicates(zip_paths)
+    ]
+    # Largest first so one big zip doesn't end up on its own at the end
+    jobs.sort(key=lambda job: job[0].stat().st_size, reverse=True)
+    imported: dict[str, list[str]] = dict()
+    digests: dict[str, str] = dict()
+    written = 0
+    unchanged = 0
+    with multiprocessing.Pool(args.jobs) as pool:
+        for (
+            full_zip_path,
+            digest,
+            short_name,
+            short_version,
+            extracted,
+            message,
+        ) in pool.imap_unordered(_import_zip, jobs):
+            if message is not None:
+                print(message, file=sys.stderr)
+            written += extracted
+            if digest is None:
                 continue
-            short_name = disa_to_shortname[product]
-            for file_info in z.infolist():
-                if file_info.filename.endswith(".xml"):
-                    with z.open(file_info) as file:
-                        filename = f"{short_version}.xml"
-                        output_path = root / "products" / short_name / filename
-                        if not output_path.exists():
-                            xml_content = file.read().decode("utf-8")
-                            output_path.write_text(xml_content)
-                        else:
-                            print(
-                                f"File {str(output_path)} already exists for {short_name}.",
-                                file=sys.stderr,
-                            )
-                        product_toml_path = (
-                            root / "products" / short_name / "product.toml"
-                        )
-                        if short_version in product_toml_path.read_text():
-                            continue
-                        with open(product_toml_path, "a") as f:
-                            f.write(f"[stigs.{short_version}]\n")
-                            f.write(f"release_date = {args.release_date}\n")
-
+            if digest == manifest.get(full_zip_path.name):
+                unchanged += 1
+            digests[full_zip_path.name] = digest
+            imported.setdefault(short_name, []).append(short_version)
+    for short_name, short_versions in sorted(imported.items()):
+        product_toml_path = root / "products" / short_name / "product.toml"
+        if not product_toml_path.exists():
+            print(f"No {product_toml_path} to add {short_name} to", file=sys.stderr)
+            continue
+        _add_stigs(product_toml_path, short_versions, args.release_date)
+    # Only record zips once their product.toml has been updated
+    _save_manifest(args.manifest, manifest | digests)
+    skipped = len(zip_paths) - written - unchanged
+    print(f"Imported {written} zips, {unchanged} unchanged, {skipped} skipped")
     return 0
 
 